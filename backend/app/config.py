@@ -1,3 +1,4 @@
+from pydantic import AliasChoices, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 import os
 from pathlib import Path
@@ -23,8 +24,18 @@ class Settings(BaseSettings):
     mysql_password: str = "planing"
     mysql_db: str = "planing"
     sqlite_path: str = "planing.db"
+    # Пул соединений MySQL (для SQLite не используется)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
 
     jira_secrets_file: str = "../jira_secrets.env"
+    # Потоков на загрузку worklog'ов по задачам (legacy-путь). 0 — по размеру пула соединений Jira;
+    # больше размера пула (JIRA_POOL_MAXSIZE) не поднимается.
+    # Задается через PLANNIG_WORKLOG_WORKERS или WORKLOG_MAX_WORKERS.
+    worklog_max_workers: int = Field(
+        default=0,
+        validation_alias=AliasChoices("PLANNIG_WORKLOG_WORKERS", "WORKLOG_MAX_WORKERS"),
+    )
     session_secret_key: str = "change-this-secret-key-in-production"
 
     # DevSamurai Timesheet Builder (TimePlanner) — для учета logtimeType=custom_task/Event и т.п.
@@ -3,6 +3,7 @@ from __future__ import annotations
 import argparse
 import base64
 import os
+import threading
 from dataclasses import dataclass
 from datetime import datetime
 from time import perf_counter
@@ -42,18 +43,25 @@ def _mask_chat_id(chat_id: str) -> str:
     return f"{chat[:2]}***{chat[-2:]}"
 
 
-def _build_jira_client_from_credential(credential: ApiCredential) -> tuple[Jira, str]:
+# Процессный кэш Jira-клиентов по (credential_id, updated_at): после изменения ключа/почты
+# updated_at меняется и клиент пересоздается. Секреты в ключ кэша не входят — их знает
+# только сам клиент (заголовок Authorization его сессии). Клиент держит requests.Session,
+# так что keep-alive соединения переиспользуются между запусками.
+JIRA_CLIENT_CACHE_MAX = 64
+_JIRA_CLIENT_CACHE: dict[tuple[int, datetime | None], tuple[Jira, str]] = {}
+_JIRA_CLIENT_CACHE_LOCK = threading.Lock()
+
+
+def _build_jira_client(api_key: str, email: str) -> tuple[Jira, str]:
     load_env_file(settings.jira_secrets_file_abs)
     base_url = (os.getenv("JIRA_BASE_URL") or "").strip()
     if not base_url:
         raise RuntimeError("JIRA_BASE_URL не настроен в конфигурации")
 
-    api_key = (credential.jira_api_key or "").strip()
     if not api_key:
         raise RuntimeError("Пустой Jira API key у credential")
 
     headers = {"Accept": "application/json"}
-    email = (credential.jira_email or "").strip()
     if email:
         raw = f"{email}:{api_key}".encode("utf-8")
         headers["Authorization"] = "Basic " + base64.b64encode(raw).decode("ascii")
@@ -65,6 +73,25 @@ def _build_jira_client_from_credential(credential: ApiCredential) -> tuple[Jira,
     return jira, api_prefix
 
 
+def _build_jira_client_from_credential(credential: ApiCredential) -> tuple[Jira, str]:
+    cache_key = (credential.id, credential.updated_at)
+    with _JIRA_CLIENT_CACHE_LOCK:
+        cached = _JIRA_CLIENT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    client = _build_jira_client((credential.jira_api_key or "").strip(), (credential.jira_email or "").strip())
+    with _JIRA_CLIENT_CACHE_LOCK:
+        # Клиенты прежних версий этого credential больше не понадобятся
+        for k in [k for k in _JIRA_CLIENT_CACHE if k[0] == credential.id]:
+            del _JIRA_CLIENT_CACHE[k]
+        # Переполнен — вытесняем самые старые записи (dict хранит порядок вставки)
+        for k in list(_JIRA_CLIENT_CACHE)[: max(len(_JIRA_CLIENT_CACHE) + 1 - JIRA_CLIENT_CACHE_MAX, 0)]:
+            del _JIRA_CLIENT_CACHE[k]
+        _JIRA_CLIENT_CACHE[cache_key] = client
+    return client
+
+
 def _build_summary_text(team_name: str, rows: list[dict]) -> str:
     if not rows:
         return f"{team_name}\nЗа предыдущий рабочий день списаний нет."
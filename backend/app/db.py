@@ -12,6 +12,8 @@ engine = create_engine(
     settings.sqlalchemy_database_uri,
     pool_pre_ping=True,
     pool_recycle=3600,
+    # Размер пула задаем только для MySQL: SQLite — локальный файл, ему хватает пула по умолчанию
+    **({"pool_size": settings.db_pool_size, "max_overflow": settings.db_max_overflow} if settings.use_mysql else {}),
 )
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, class_=Session)
@@ -1,9 +1,39 @@
 import base64
 import os
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+# Список полей Jira меняется редко, а запрашивается на каждый sync/авторизацию/worklog.
+# Кэшируем на уровне процесса по (base_url, api_prefix).
+FIELDS_CACHE_TTL_S = 300
+_FIELDS_CACHE: Dict[Tuple[str, str], Tuple[float, List[dict]]] = {}
+# Найденный id поля по (base_url, api_prefix, имя) — привязан к времени загрузки списка полей
+# в _FIELDS_CACHE и устаревает вместе с ним; линейный поиск по /field только при перезагрузке.
+_FIELD_ID_CACHE: Dict[Tuple[str, str, str], Tuple[float, str]] = {}
+# REST-префикс (v3/v2) — свойство сервера, а не ключа: кэшируем по base_url.
+API_PREFIX_CACHE_TTL_S = 600
+_API_PREFIX_CACHE: Dict[str, Tuple[float, str]] = {}
+# Пул соединений сессии: не меньше числа потоков, которые параллельно ходят в Jira одним клиентом
+JIRA_POOL_MAXSIZE = 16
+
+
+def response_json(r: requests.Response) -> Any:
+    """
+    JSON тела ответа. С orjson (если установлен) парсим сырые байты — на страницах
+    поиска/пользователей в сотни КБ это в разы быстрее r.json(); Jira всегда отдает UTF-8.
+    """
+    if orjson is not None:
+        return orjson.loads(r.content)
+    return r.json()
 
 
 def load_env_file(path: str) -> None:
@@ -41,6 +71,16 @@ class Jira:
         if not use_system_proxy:
             self.session.proxies = {}
         self.session.headers.update(headers)
+        # Keep-alive пул на JIRA_POOL_MAXSIZE соединений, чтобы параллельные запросы не открывали
+        # новые TCP+TLS сверх пула. Повторы — только на 502/503/504 для идемпотентных методов;
+        # 429 обрабатывается в request() по Retry-After, ответ с ошибкой возвращается как есть.
+        adapter = HTTPAdapter(
+            pool_connections=JIRA_POOL_MAXSIZE,
+            pool_maxsize=JIRA_POOL_MAXSIZE,
+            max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504), raise_on_status=False),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.timeout_s = timeout_s
     
     def request(self, method: str, path: str, *, params: Optional[dict] = None, json_body: Optional[dict] = None) -> requests.Response:
@@ -56,17 +96,58 @@ class Jira:
         forced = (forced or "").strip()
         if forced:
             return forced.rstrip("/")
+        cached = _API_PREFIX_CACHE.get(self.base_url)
+        if cached is not None and time.time() - cached[0] < API_PREFIX_CACHE_TTL_S:
+            return cached[1]
         for prefix in ("/rest/api/3", "/rest/api/2"):
             r = self.request("GET", f"{prefix}/serverInfo")
             if r.status_code in (200, 401, 403):
+                _API_PREFIX_CACHE[self.base_url] = (time.time(), prefix)
                 return prefix
         raise RuntimeError("Не удалось определить Jira REST API префикс. Укажите api_prefix.")
 
+    def _cached_fields(self, api_prefix: str) -> Optional[List[dict]]:
+        cached = _FIELDS_CACHE.get((self.base_url, api_prefix))
+        if cached is None or time.time() - cached[0] >= FIELDS_CACHE_TTL_S:
+            return None
+        return cached[1]
+
     def get_fields(self, api_prefix: str) -> List[dict]:
+        fields = self._cached_fields(api_prefix)
+        if fields is not None:
+            return fields
         r = self.request("GET", f"{api_prefix}/field")
         if r.status_code != 200:
             raise RuntimeError(f"Не удалось получить поля: HTTP {r.status_code}: {r.text}")
-        return r.json()
+        fields = response_json(r)
+        _FIELDS_CACHE[(self.base_url, api_prefix)] = (time.time(), fields)
+        return fields
+
+    def get_field_id(self, api_prefix: str, field_name: str) -> str:
+        """
+        find_field_id поверх кэша get_fields.
+        Если поле не нашлось в закэшированном списке — перечитываем /field один раз
+        (поле могли создать после заполнения кэша).
+        """
+        id_key = (self.base_url, api_prefix, field_name.strip().lower())
+        # Запись кэша читаем один раз: другой поток может вытеснить ее между проверками
+        cached = _FIELDS_CACHE.get((self.base_url, api_prefix))
+        from_cache = cached is not None and time.time() - cached[0] < FIELDS_CACHE_TTL_S
+        if from_cache:
+            memo = _FIELD_ID_CACHE.get(id_key)
+            if memo is not None and memo[0] == cached[0]:
+                return memo[1]
+        try:
+            field_id = find_field_id(self.get_fields(api_prefix), field_name)
+        except RuntimeError:
+            if not from_cache:
+                raise
+            _FIELDS_CACHE.pop((self.base_url, api_prefix), None)
+            field_id = find_field_id(self.get_fields(api_prefix), field_name)
+        fields_entry = _FIELDS_CACHE.get((self.base_url, api_prefix))
+        if fields_entry is not None:
+            _FIELD_ID_CACHE[id_key] = (fields_entry[0], field_id)
+        return field_id
 
     def search_jql_page(self, jql: str, fields: List[str], max_results: int, next_page_token: str = "") -> dict:
         body: Dict[str, Any] = {"jql": jql, "fields": fields, "maxResults": max_results}
@@ -75,14 +156,67 @@ class Jira:
         r = self.request("POST", "/rest/api/3/search/jql", json_body=body)
         if r.status_code != 200:
             raise RuntimeError(f"Search (jql) failed: HTTP {r.status_code}: {r.text}")
-        return r.json()
+        return response_json(r)
 
-    def get_worklog(self, api_prefix: str, issue_key: str) -> dict:
-        """Получить worklog для задачи."""
-        r = self.request("GET", f"{api_prefix}/issue/{issue_key}/worklog")
+    def get_worklog(
+        self,
+        api_prefix: str,
+        issue_key: str,
+        *,
+        started_after_ms: Optional[int] = None,
+        started_before_ms: Optional[int] = None,
+    ) -> dict:
+        """
+        Получить worklog для задачи.
+        started_after_ms/started_before_ms — фильтр по дате списания на стороне Jira
+        (Cloud его поддерживает, старые Server-версии игнорируют — фильтровать по started все равно нужно).
+        """
+        params: Dict[str, Any] = {}
+        if started_after_ms is not None:
+            params["startedAfter"] = started_after_ms
+        if started_before_ms is not None:
+            params["startedBefore"] = started_before_ms
+        r = self.request("GET", f"{api_prefix}/issue/{issue_key}/worklog", params=params or None)
         if r.status_code != 200:
             raise RuntimeError(f"Get worklog failed: HTTP {r.status_code}: {r.text}")
-        return r.json()
+        return response_json(r)
+
+    def worklog_updated_ids(self, api_prefix: str, since_ms: int, max_pages: int = 50) -> List[int]:
+        """
+        id всех worklog'ов, измененных начиная с since_ms (/worklog/updated).
+        Пагинация через until/lastPage: пока lastPage=false, повторяем с since=until.
+        """
+        ids: List[int] = []
+        seen: set[int] = set()
+        for _ in range(max_pages):
+            r = self.request("GET", f"{api_prefix}/worklog/updated", params={"since": since_ms})
+            if r.status_code != 200:
+                raise RuntimeError(f"worklog/updated failed: HTTP {r.status_code}: {r.text}")
+            payload = response_json(r) or {}
+            for v in payload.get("values") or []:
+                wid = v.get("worklogId")
+                if isinstance(wid, int) and wid not in seen:
+                    seen.add(wid)
+                    ids.append(wid)
+            if payload.get("lastPage") is True:
+                break
+            until_ms = payload.get("until")
+            if not isinstance(until_ms, int) or until_ms <= since_ms:
+                break
+            since_ms = until_ms
+        return ids
+
+    def worklog_list(self, api_prefix: str, ids: List[int], chunk_size: int = 1000) -> List[dict]:
+        """Тела worklog'ов по id (/worklog/list), чанками по 1000 — больше Jira не принимает."""
+        out: List[dict] = []
+        for i in range(0, len(ids), chunk_size):
+            r = self.request("POST", f"{api_prefix}/worklog/list", json_body={"ids": ids[i : i + chunk_size]})
+            if r.status_code != 200:
+                raise RuntimeError(f"worklog/list failed: HTTP {r.status_code}: {r.text}")
+            data = response_json(r) or []
+            if isinstance(data, list):
+                out.extend(x for x in data if isinstance(x, dict))
+        return out
 
     def create_issue(
         self,
@@ -264,16 +398,23 @@ def extract_team_values(v: Any) -> List[dict]:
     Возвращает список объектов команд (как приходят из Jira): минимум {id, name/title}.
     TEAM может быть dict или list[dict].
     """
+    # Вызывается на каждую задачу при sync, поэтому частые случаи проверяем первыми
     if v is None:
         return []
     if isinstance(v, dict):
         return [v]
     if isinstance(v, list):
+        if len(v) == 1:
+            item = v[0]
+            if isinstance(item, dict) and (item.get("id") or item.get("name") or item.get("title")):
+                return [item]
+            return []
         out: List[dict] = []
         seen: set[str] = set()
         for item in v:
             if isinstance(item, dict):
-                tid = str(item.get("id") or item.get("name") or item.get("title") or "")
+                get = item.get
+                tid = str(get("id") or get("name") or get("title") or "")
                 if tid and tid not in seen:
                     out.append(item)
                     seen.add(tid)
@@ -284,15 +425,15 @@ def extract_team_values(v: Any) -> List[dict]:
 def normalize_user(u: Any) -> Optional[dict]:
     if not isinstance(u, dict):
         return None
-    account_id = u.get("accountId")
-    display = u.get("displayName") or u.get("name") or account_id or ""
+    get = u.get
+    account_id = get("accountId")
     if not account_id:
         return None
     return {
         "accountId": account_id,
-        "displayName": display,
-        "email": u.get("emailAddress"),
-        "active": bool(u.get("active", True)),
+        "displayName": get("displayName") or get("name") or account_id,
+        "email": get("emailAddress"),
+        "active": bool(get("active", True)),
     }
 
 
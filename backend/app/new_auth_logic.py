@@ -13,7 +13,6 @@ def verify_api_key_new(request: Request, api_key: str = Form(...), email: str =
     6. Перенаправляет на страницу выбора команд
     """
     from .db import SessionLocal
-    from .jira_client import find_field_id
     import uuid
 
     api_key = (api_key or "").strip()
@@ -54,8 +53,7 @@ def verify_api_key_new(request: Request, api_key: str = Form(...), email: str =
 
         # 2) Проверяем наличие поля TEAM
         try:
-            fields = jira.get_fields(api_prefix)
-            team_field_id = find_field_id(fields, "TEAM")
+            team_field_id = jira.get_field_id(api_prefix, "TEAM")
             print(f"Поле TEAM найдено: {team_field_id}")
         except RuntimeError as e:
             error_msg = str(e)
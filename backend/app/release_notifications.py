@@ -73,7 +73,23 @@ def run_release_notifications(
         for setting, team, credential in targets:
             grouped_by_chat.setdefault(setting.chat_id, []).append((setting, team, credential))
 
-        jira_cache: dict[int, tuple] = {}
+        # Выборка релизов зависит только от credential (JQL и фильтры одинаковые),
+        # поэтому ходим в Jira один раз на credential и раздаем результат всем чатам.
+        releases_by_cred: dict[int, list[dict] | Exception] = {}
+        for _setting, _team, credential in targets:
+            if credential.id in releases_by_cred:
+                continue
+            try:
+                jira, _api_prefix = _build_jira_client_from_credential(credential)
+
+                releases_by_cred[credential.id] = get_releases_for_current_user(
+                    jira,
+                    due_on_or_before=today,
+                    only_unreleased=True,
+                    only_current_user_assignee=False,
+                )
+            except Exception as exc:  # noqa: BLE001
+                releases_by_cred[credential.id] = exc
 
         for chat_id, grouped_targets in grouped_by_chat.items():
             started = perf_counter()
@@ -87,18 +103,9 @@ def run_release_notifications(
                         continue
                     unique_credential_ids.add(credential.id)
 
-                    jira_and_prefix = jira_cache.get(credential.id)
-                    if jira_and_prefix is None:
-                        jira_and_prefix = _build_jira_client_from_credential(credential)
-                        jira_cache[credential.id] = jira_and_prefix
-                    jira, _api_prefix = jira_and_prefix
-
-                    releases = get_releases_for_current_user(
-                        jira,
-                        due_on_or_before=today,
-                        only_unreleased=True,
-                        only_current_user_assignee=False,
-                    )
+                    releases = releases_by_cred[credential.id]
+                    if isinstance(releases, Exception):
+                        raise releases
                     merged_releases.extend(releases)
 
                 deduped_by_key: dict[tuple[str, str, str], dict] = {}
@@ -1,13 +1,57 @@
 from __future__ import annotations
 
-from typing import Dict, List, Tuple, Optional
+import hashlib
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
-from .jira_client import Jira, extract_team_values, find_field_id, normalize_user
+from .jira_client import JIRA_POOL_MAXSIZE, Jira, extract_team_values, find_field_id, normalize_user, response_json
 from .models import CredentialTeam, CredentialUser, Team, TeamMember, User
 
+# Jira сама ограничивает размер страницы (обычно до 1000 для пользователей и 100-1000 для JQL),
+# поэтому просим максимум и подстраиваемся под ответ — меньше HTTP round-trip'ов.
+USERS_PAGE_SIZE = 1000
+SEARCH_PAGE_SIZE = 1000
+MIN_SEARCH_PAGE_SIZE = 50
+# Сколько страниц пользователей запрашиваем параллельно (не больше пула соединений Jira-сессии)
+USERS_FETCH_WORKERS = min(4, JIRA_POOL_MAXSIZE)
+# До скольких пользователей в БД грузим их всех в память в начале sync;
+# на больших инсталляциях остаемся на пакетных SELECT ... IN по страницам.
+PREFETCH_USERS_LIMIT = 100_000
+# Строк в одном multi-row INSERT: держим стейтмент в пределах лимита bind-параметров
+# SQLite и max_allowed_packet MySQL даже для больших страниц team_members
+INSERT_BATCH_SIZE = 500
+# Раз в столько страниц поиска фиксируем транзакцию, чтобы не держать ее открытой весь sync
+SYNC_COMMIT_EVERY_PAGES = 10
+# Результат credential_has_any_team на (Jira, ключ, поле) живет столько секунд.
+# Ключ — sha256 заголовка Authorization, а не сам заголовок: секреты в памяти процесса не храним.
+HAS_TEAM_CACHE_TTL_S = 60
+HAS_TEAM_CACHE_MAX = 1000
+_HAS_TEAM_CACHE: Dict[Tuple[str, str, str, str], Tuple[float, bool]] = {}
+_HAS_TEAM_CACHE_LOCK = threading.Lock()
+
+
+@dataclass(slots=True)
+class _KnownRows:
+    """
+    Кэш строк БД на время одного sync: ключ Jira -> кортеж колонок.
+    complete=True — загружены все строки, и промах в кэше означает новую запись без запроса в БД.
+    Безопасно только потому, что sync — единственный writer этих таблиц.
+    """
+
+    rows: Dict[str, tuple] = field(default_factory=dict)
+    complete: bool = False
+
 
 def _fetch_jira_users_page(jira: Jira, api_prefix: str, *, start_at: int, max_results: int) -> list[dict]:
     """
@@ -27,7 +71,7 @@ def _fetch_jira_users_page(jira: Jira, api_prefix: str, *, start_at: int, max_re
         if r.status_code != 200:
             last_error = f"{path}: HTTP {r.status_code}"
             continue
-        data = r.json()
+        data = response_json(r)
         if isinstance(data, list):
             return data
         last_error = f"{path}: unexpected payload type {type(data).__name__}"
@@ -37,66 +81,305 @@ def _fetch_jira_users_page(jira: Jira, api_prefix: str, *, start_at: int, max_re
     return []
 
 
+def _insert_on_conflict(
+    db: Session,
+    model: Any,
+    rows: List[dict],
+    *,
+    index_elements: List[str],
+    set_: Callable[[Any], Dict[str, Any]] | None = None,
+) -> None:
+    """
+    Пакетный INSERT с обработкой конфликтов по уникальному ключу для текущего диалекта:
+    SQLite/PostgreSQL — ON CONFLICT, MySQL — ON DUPLICATE KEY UPDATE / INSERT IGNORE.
+    set_ получает excluded-строку и возвращает обновляемые колонки; без set_ — DO NOTHING.
+    Большие пачки режутся на стейтменты по INSERT_BATCH_SIZE строк.
+    """
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("mysql", "sqlite", "postgresql"):
+        raise RuntimeError(f"Upsert не поддерживается для диалекта БД: {dialect}")
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[i : i + INSERT_BATCH_SIZE]
+        if dialect == "mysql":
+            stmt = mysql_insert(model).values(batch)
+            if set_ is None:
+                stmt = stmt.prefix_with("IGNORE")
+            else:
+                stmt = stmt.on_duplicate_key_update(set_(stmt.inserted))
+        else:
+            stmt = (sqlite_insert if dialect == "sqlite" else pg_insert)(model).values(batch)
+            if set_ is None:
+                stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+            else:
+                stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_(stmt.excluded))
+        db.execute(stmt)
+
+
+def _search_team_issues_page(
+    jira: Jira,
+    *,
+    jql: str,
+    fields: List[str],
+    page_size: int,
+    next_token: str,
+) -> Tuple[dict, int]:
+    """
+    Страница JQL-поиска. Если инстанс отвергает такой размер страницы (HTTP 400/413),
+    уменьшаем его вдвое и повторяем. Возвращает (data, фактический page_size).
+    """
+    while True:
+        try:
+            return jira.search_jql_page(jql=jql, fields=fields, max_results=page_size, next_page_token=next_token), page_size
+        except RuntimeError as e:
+            if page_size > MIN_SEARCH_PAGE_SIZE and ("HTTP 400" in str(e) or "HTTP 413" in str(e)):
+                page_size = max(page_size // 2, MIN_SEARCH_PAGE_SIZE)
+                print(f"Warning: search page rejected, retry with maxResults={page_size}")
+                continue
+            raise
+
+
+def _prefetch_users(db: Session) -> _KnownRows:
+    """
+    Все пользователи в память одним запросом, если их не слишком много.
+    """
+    known = _KnownRows()
+    if (db.scalar(select(func.count()).select_from(User)) or 0) > PREFETCH_USERS_LIMIT:
+        return known
+    for acct, user_id, display_name, email, active in db.execute(
+        select(User.jira_account_id, User.id, User.display_name, User.email, User.active)
+    ).tuples():
+        known.rows[acct] = (user_id, display_name, email, active)
+    known.complete = True
+    return known
+
+
+def _prefetch_teams(db: Session, team_field_id: str) -> _KnownRows:
+    known = _KnownRows(complete=True)
+    for jira_team_id, team_id, name in db.execute(
+        select(Team.jira_team_id, Team.id, Team.name).where(Team.jira_field_id == team_field_id)
+    ).tuples():
+        known.rows[jira_team_id] = (team_id, name)
+    return known
+
+
+def _upsert_users(db: Session, normalized: List[dict], known: _KnownRows) -> Tuple[Dict[str, int], int]:
+    """
+    Upsert пользователей одной страницы одним INSERT ... ON CONFLICT.
+    known — кэш {accountId: (user_id, display_name, email, active)} на весь sync.
+    В стейтмент попадают только новые и изменившиеся пользователи: неизменные строки не переписываем.
+    Возвращает ({accountId: user_id}, количество созданных).
+    """
+    rows_by_acct: Dict[str, dict] = {}
+    for nu in normalized:
+        rows_by_acct[nu["accountId"]] = {
+            "jira_account_id": nu["accountId"],
+            "display_name": nu["displayName"] or nu["accountId"],
+            "email": nu.get("email") or None,
+            "active": bool(nu.get("active", True)),
+        }
+    if not rows_by_acct:
+        return {}, 0
+
+    unknown = [acct for acct in rows_by_acct if acct not in known.rows]
+    if unknown and not known.complete:
+        for acct, user_id, display_name, email, active in db.execute(
+            select(User.jira_account_id, User.id, User.display_name, User.email, User.active).where(
+                User.jira_account_id.in_(unknown)
+            )
+        ).tuples():
+            known.rows[acct] = (user_id, display_name, email, active)
+    new_accts = [acct for acct in rows_by_acct if acct not in known.rows]
+
+    changed_rows: List[dict] = []
+    for acct, row in rows_by_acct.items():
+        cur = known.rows.get(acct)
+        if cur is not None:
+            # почту не затираем, если Jira ее не отдала (privacy)
+            row["email"] = row["email"] or cur[2]
+            if (row["display_name"], row["email"], row["active"]) == cur[1:]:
+                continue
+            known.rows[acct] = (cur[0], row["display_name"], row["email"], row["active"])
+        changed_rows.append(row)
+
+    _insert_on_conflict(
+        db,
+        User,
+        changed_rows,
+        index_elements=["jira_account_id"],
+        set_=lambda excluded: {
+            "display_name": excluded.display_name,
+            "email": func.coalesce(excluded.email, User.email),
+            "active": excluded.active,
+            "updated_at": func.now(),
+        },
+    )
+    if new_accts:
+        for acct, user_id in db.execute(
+            select(User.jira_account_id, User.id).where(User.jira_account_id.in_(new_accts))
+        ).tuples():
+            row = rows_by_acct[acct]
+            known.rows[acct] = (user_id, row["display_name"], row["email"], row["active"])
+    return {acct: known.rows[acct][0] for acct in rows_by_acct}, len(new_accts)
+
+
+def _upsert_teams(
+    db: Session,
+    team_field_id: str,
+    teams: List[Tuple[str, str]],
+    known: _KnownRows,
+) -> Tuple[Dict[str, int], int]:
+    """
+    Upsert команд страницы (jira_team_id, name) одним INSERT ... ON CONFLICT.
+    known — кэш {jira_team_id: (team_id, name)} на весь sync: одна команда встречается
+    в тысячах задач, поэтому из БД читаем ее один раз, а пишем только новые/переименованные.
+    Возвращает ({jira_team_id: team_id}, количество созданных).
+    """
+    names_by_jira_id: Dict[str, str] = {}
+    for jira_team_id, name in teams:
+        names_by_jira_id[jira_team_id] = name
+    if not names_by_jira_id:
+        return {}, 0
+
+    unknown = [jira_team_id for jira_team_id in names_by_jira_id if jira_team_id not in known.rows]
+    if unknown and not known.complete:
+        for jira_team_id, team_id, name in db.execute(
+            select(Team.jira_team_id, Team.id, Team.name).where(
+                Team.jira_field_id == team_field_id, Team.jira_team_id.in_(unknown)
+            )
+        ).tuples():
+            known.rows[jira_team_id] = (team_id, name)
+    new_ids = [jira_team_id for jira_team_id in names_by_jira_id if jira_team_id not in known.rows]
+
+    _insert_on_conflict(
+        db,
+        Team,
+        [
+            {"jira_field_id": team_field_id, "jira_team_id": jira_team_id, "name": name}
+            for jira_team_id, name in names_by_jira_id.items()
+            if jira_team_id not in known.rows or known.rows[jira_team_id][1] != name
+        ],
+        index_elements=["jira_field_id", "jira_team_id"],
+        set_=lambda excluded: {"name": excluded.name, "updated_at": func.now()},
+    )
+    if new_ids:
+        for jira_team_id, team_id in db.execute(
+            select(Team.jira_team_id, Team.id).where(Team.jira_field_id == team_field_id, Team.jira_team_id.in_(new_ids))
+        ).tuples():
+            known.rows[jira_team_id] = (team_id, names_by_jira_id[jira_team_id])
+    for jira_team_id, name in names_by_jira_id.items():
+        known.rows[jira_team_id] = (known.rows[jira_team_id][0], name)
+    return {jira_team_id: known.rows[jira_team_id][0] for jira_team_id in names_by_jira_id}, len(new_ids)
+
+
+def _link_credential_users(db: Session, credential_id: int, user_ids: List[int], linked: set[int]) -> None:
+    """
+    Привязка пользователей к credential (изоляция).
+    linked — уже привязанные user_id (предвыборка на весь sync), пополняется новыми.
+    """
+    new_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in linked]
+    _insert_on_conflict(
+        db,
+        CredentialUser,
+        [{"credential_id": credential_id, "user_id": user_id} for user_id in new_ids],
+        index_elements=["credential_id", "user_id"],
+    )
+    linked.update(new_ids)
+
+
+def _delete_stale_links(db: Session, column: Any, credential_id: int, ids: set[int]) -> None:
+    """
+    Удаляет связи credential с перечисленными user_id/team_id (column — колонка модели связи).
+    """
+    model = column.class_
+    id_list = list(ids)
+    for i in range(0, len(id_list), INSERT_BATCH_SIZE):
+        db.execute(
+            delete(model).where(model.credential_id == credential_id, column.in_(id_list[i : i + INSERT_BATCH_SIZE])),
+            execution_options={"synchronize_session": False},
+        )
+
+
+def _linked_credential_user_ids(db: Session, credential_id: int) -> set[int]:
+    return set(db.scalars(select(CredentialUser.user_id).where(CredentialUser.credential_id == credential_id)).all())
+
+
 def sync_all_jira_users(
     jira: Jira,
     api_prefix: str,
     db: Session,
     *,
     credential_id: int | None = None,
+    linked_user_ids: set[int] | None = None,
+    known_users: _KnownRows | None = None,
+    seen_user_ids: set[int] | None = None,
 ) -> int:
     """
     Синхронизирует всех пользователей Jira через API /users/search.
     Возвращает количество созданных пользователей.
-    Если передан credential_id, дополнительно создает связи credential_users.
+    Если передан credential_id, дополнительно создает связи credential_users
+    (linked_user_ids — уже привязанные к нему user_id, если вызывающий их знает).
+    seen_user_ids, если передан, пополняется id всех встреченных пользователей.
     """
+    if credential_id is not None and linked_user_ids is None:
+        linked_user_ids = _linked_credential_user_ids(db, credential_id)
+    if known_users is None:
+        known_users = _prefetch_users(db)
     created_count = 0
-    start_at = 0
-    max_results = 50  # Jira API ограничение
-    
-    while True:
-        users_data = _fetch_jira_users_page(jira, api_prefix, start_at=start_at, max_results=max_results)
-        if not users_data or not isinstance(users_data, list):
-            break
-        
-        for user_data in users_data:
-            nu = normalize_user(user_data)
-            if not nu:
-                continue
-            
-            user = db.scalar(select(User).where(User.jira_account_id == nu["accountId"]))
-            if user is None:
-                user = User(
-                    jira_account_id=nu["accountId"],
-                    display_name=nu["displayName"] or nu["accountId"],
-                    email=nu.get("email"),
-                    active=bool(nu.get("active", True)),
-                )
-                db.add(user)
-                db.flush()
-                created_count += 1
-            else:
-                # Обновляем данные пользователя
-                user.display_name = nu["displayName"] or user.display_name
-                if nu.get("email"):
-                    user.email = nu.get("email")
-                user.active = bool(nu.get("active", True))
-
-            if credential_id is not None:
-                cu = db.scalar(
-                    select(CredentialUser).where(
-                        CredentialUser.credential_id == credential_id,
-                        CredentialUser.user_id == user.id,
-                    )
-                )
-                if cu is None:
-                    db.add(CredentialUser(credential_id=credential_id, user_id=user.id))
-        
-        if len(users_data) < max_results:
-            break
-        
-        start_at += max_results
-    
-    db.flush()
+
+    def _process(users_data: list[dict]) -> None:
+        nonlocal created_count
+        page_users = [nu for nu in (normalize_user(u) for u in users_data) if nu]
+        users_by_acct, created = _upsert_users(db, page_users, known_users)
+        created_count += created
+        if seen_user_ids is not None:
+            seen_user_ids.update(users_by_acct.values())
+
+        if credential_id is not None:
+            _link_credential_users(db, credential_id, list(users_by_acct.values()), linked_user_ids)
+
+    # Просим максимум; если сервер режет страницу сильнее — подстраиваемся под его размер
+    max_results = USERS_PAGE_SIZE
+    users_data = _fetch_jira_users_page(jira, api_prefix, start_at=0, max_results=max_results)
+    if not users_data or not isinstance(users_data, list):
+        return created_count
+    if len(users_data) < max_results:
+        # Короткая первая страница — это либо все пользователи, либо лимит сервера.
+        # Отличить нельзя, поэтому продолжаем с фактическим размером страницы:
+        # в худшем случае это одно окно (USERS_FETCH_WORKERS) лишних пустых запросов.
+        print(f"Warning: Jira returned {len(users_data)} users for maxResults={max_results}, using it as page size")
+        max_results = len(users_data)
+    _process(users_data)
+
+    # Дальше startAt известен заранее, поэтому держим в полете окно из USERS_FETCH_WORKERS страниц,
+    # а запись в БД идет последовательно в текущем потоке. Цена окна: после последней страницы
+    # может уйти до USERS_FETCH_WORKERS лишних запросов (еще не начатые отменяются, начатые
+    # дорабатывают вхолостую). Потоки делят одну jira.session: это только GET без смены
+    # cookies/заголовков, а пул соединений сессии (JIRA_POOL_MAXSIZE) потокобезопасен и не
+    # меньше окна, так что потоки не ждут соединения и не открывают новых.
+    next_start = len(users_data)
+    with ThreadPoolExecutor(max_workers=USERS_FETCH_WORKERS) as executor:
+        pending: deque[Future] = deque()
+        for _ in range(USERS_FETCH_WORKERS):
+            pending.append(
+                executor.submit(_fetch_jira_users_page, jira, api_prefix, start_at=next_start, max_results=max_results)
+            )
+            next_start += max_results
+        while pending:
+            users_data = pending.popleft().result()
+            if not users_data or not isinstance(users_data, list):
+                break
+            _process(users_data)
+            if len(users_data) < max_results:
+                break
+            pending.append(
+                executor.submit(_fetch_jira_users_page, jira, api_prefix, start_at=next_start, max_results=max_results)
+            )
+            next_start += max_results
+        for future in pending:
+            future.cancel()
+
     return created_count
 
 
@@ -110,6 +393,7 @@ def sync_from_jira_for_credential(
     user_fields: List[str] | None = None,
     clear_existing_links: bool = True,
     sync_all_users: bool = True,  # Новый параметр для синхронизации всех пользователей
+    prefetch_users: bool = True,
 ) -> Dict[str, int]:
     """
     Подтягивает команды и пользователей из Jira по задачам, где TEAM не пустой,
@@ -118,14 +402,20 @@ def sync_from_jira_for_credential(
     - upsert users (из задач + все пользователи Jira, если sync_all_users=True)
     - upsert team_members (связь)
     - upsert credential_teams / credential_users (изоляция пользователей)
+    prefetch_users=True — в начале загрузить всех пользователей в память (до PREFETCH_USERS_LIMIT),
+    иначе пользователи читаются пакетными SELECT ... IN по страницам.
+
+    Все записи идут пакетными Core-стейтментами через db.execute (по одному на таблицу
+    на страницу), поэтому в unit of work ничего не копится и промежуточные flush не нужны.
     """
     user_fields = user_fields or ["assignee"]
 
+    # Ошибки /field (401/403/5xx) уходят наверх: список полей читаем вне try (из кэша get_fields)
     fields = jira.get_fields(api_prefix)
-    
+
     # Пытаемся найти поле TEAM, если не найдено - просто возвращаем пустой результат
     try:
-        team_field_id = find_field_id(fields, team_field_name)
+        team_field_id = sys.intern(find_field_id(fields, team_field_name))
     except RuntimeError:
         # Поле TEAM не найдено - это нормально, не все Jira инстансы имеют это поле
         # Но если sync_all_users=True, все равно синхронизируем пользователей
@@ -137,130 +427,171 @@ def sync_from_jira_for_credential(
                 print(f"Warning: Failed to sync all users: {e}")
         return {"teams_created": 0, "users_created": 0, "links_created": 0}
 
-    # Важно: чистим связи только после успешного определения TEAM-поля.
-    # Иначе при временной ошибке/особенностях Jira можно потерять доступ к уже
-    # синхронизированным командам.
-    if clear_existing_links:
-        db.execute(delete(CredentialTeam).where(CredentialTeam.credential_id == credential_id))
-        db.execute(delete(CredentialUser).where(CredentialUser.credential_id == credential_id))
-        db.flush()
+    # Транзакция фиксируется каждые SYNC_COMMIT_EVERY_PAGES страниц: на больших инстансах sync идет
+    # минутами. Страницы только добавляют/обновляют строки идемпотентными upsert'ами (ON CONFLICT),
+    # поэтому при ошибке откатывается лишь текущая порция, а повторный sync доделает остальное.
+    # Удаление устаревших связей (clear_existing_links) — только в самом конце, после успешного обхода.
+    # Кэши в памяти (known_*, linked_*, members_by_team) переживают commit: записанное уже в БД.
+    try:
+        # Уже существующие связи грузим один раз на весь sync и дальше проверяем по памяти;
+        # состав команд (team_members) подгружаем лениво, когда команда впервые встречается.
+        linked_user_ids = _linked_credential_user_ids(db, credential_id)
+        linked_team_ids = set(db.scalars(select(CredentialTeam.team_id).where(CredentialTeam.credential_id == credential_id)).all())
+        # clear_existing_links: вместо DELETE всех связей в начале (и повторной вставки тех же строк)
+        # запоминаем, что встретилось за sync, и в конце удаляем только то, что не встретилось.
+        # Доступ к командам при этом не пропадает на время sync.
+        stale_user_ids = set(linked_user_ids) if clear_existing_links else set()
+        stale_team_ids = set(linked_team_ids) if clear_existing_links else set()
+        seen_user_ids: set[int] = set()
+        seen_team_ids: set[int] = set()
+        members_by_team: Dict[int, set[int]] = {}
+        known_users = _prefetch_users(db) if prefetch_users else _KnownRows()
+        known_teams = _prefetch_teams(db, team_field_id)
 
-    jql = f'"{team_field_id}" is not EMPTY'
-    page_size = 200
-    next_token = ""
+        jql = f'"{team_field_id}" is not EMPTY'
+        search_fields = [team_field_id] + user_fields
 
-    created_teams = 0
-    created_users = 0
-    created_links = 0
+        created_teams = 0
+        created_users = 0
+        created_links = 0
+        pages_done = 0
 
-    while True:
-        data = jira.search_jql_page(jql=jql, fields=[team_field_id] + user_fields, max_results=page_size, next_page_token=next_token)
-        issues = data.get("issues", []) or data.get("values", [])
-        if not issues:
-            break
-
-        for issue in issues:
-            f = issue.get("fields", {})
-            teams = extract_team_values(f.get(team_field_id))
-            if not teams:
-                continue
+        data, page_size = _search_team_issues_page(jira, jql=jql, fields=search_fields, page_size=SEARCH_PAGE_SIZE, next_token="")
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            while True:
+                issues = data.get("issues", []) or data.get("values", [])
+                if not issues:
+                    break
 
-            # upsert users from user_fields once per issue
-            issue_users: List[User] = []
-            for uf in user_fields:
-                raw = f.get(uf)
-                if isinstance(raw, list):
-                    items = raw
-                else:
-                    items = [raw]
-                for item in items:
-                    nu = normalize_user(item)
-                    if not nu:
-                        continue
-                    user = db.scalar(select(User).where(User.jira_account_id == nu["accountId"]))
-                    if user is None:
-                        user = User(
-                            jira_account_id=nu["accountId"],
-                            display_name=nu["displayName"] or nu["accountId"],
-                            email=nu.get("email"),
-                            active=bool(nu.get("active", True)),
-                        )
-                        db.add(user)
-                        db.flush()
-                        created_users += 1
-                    else:
-                        # лёгкий апдейт имени/почты
-                        user.display_name = nu["displayName"] or user.display_name
-                        if nu.get("email"):
-                            user.email = nu.get("email")
-                        user.active = bool(nu.get("active", True))
-                    issue_users.append(user)
-
-                    # привязка user к credential (изоляция)
-                    cu = db.scalar(
-                        select(CredentialUser).where(
-                            CredentialUser.credential_id == credential_id,
-                            CredentialUser.user_id == user.id,
-                        )
+                # Следующую страницу запрашиваем сразу: сеть работает, пока текущая пишется в БД.
+                next_token = (data.get("nextPageToken") or "").strip()
+                next_page: Future | None = None
+                if next_token:
+                    next_page = prefetcher.submit(
+                        _search_team_issues_page,
+                        jira,
+                        jql=jql,
+                        fields=search_fields,
+                        page_size=page_size,
+                        next_token=next_token,
                     )
-                    if cu is None:
-                        db.add(CredentialUser(credential_id=credential_id, user_id=user.id))
-
-            for t in teams:
-                jira_team_id = str(t.get("id") or "")
-                name = (t.get("name") or t.get("title") or "").strip()
-                if not jira_team_id or not name:
-                    continue
-                team = db.scalar(
-                    select(Team).where(Team.jira_field_id == team_field_id, Team.jira_team_id == jira_team_id)
+
+                # Сначала разбираем страницу, чтобы потом сходить в БД пачками (SELECT ... IN),
+                # а не делать по запросу на каждого пользователя/команду/связь.
+                parsed: List[Tuple[List[dict], List[Tuple[str, str]]]] = []
+                for issue in issues:
+                    f = issue.get("fields", {})
+                    teams = extract_team_values(f.get(team_field_id))
+                    if not teams:
+                        continue
+
+                    issue_users: List[dict] = []
+                    for uf in user_fields:
+                        raw = f.get(uf)
+                        if isinstance(raw, list):
+                            items = raw
+                        else:
+                            items = [raw]
+                        for item in items:
+                            nu = normalize_user(item)
+                            if nu:
+                                # Один и тот же accountId/id команды повторяется в тысячах задач:
+                                # интернируем, чтобы ключи кэшей были одним объектом
+                                # (сравнение по identity при поиске в dict и меньше копий строк).
+                                nu["accountId"] = sys.intern(str(nu["accountId"]))
+                                issue_users.append(nu)
+
+                    issue_teams: List[Tuple[str, str]] = []
+                    for t in teams:
+                        jira_team_id = sys.intern(str(t.get("id") or ""))
+                        name = (t.get("name") or t.get("title") or "").strip()
+                        if jira_team_id and name:
+                            issue_teams.append((jira_team_id, name))
+                    parsed.append((issue_users, issue_teams))
+
+                # upsert users
+                users_by_acct, created = _upsert_users(
+                    db, [nu for issue_users, _ in parsed for nu in issue_users], known_users
+                )
+                created_users += created
+                seen_user_ids.update(users_by_acct.values())
+                _link_credential_users(db, credential_id, list(users_by_acct.values()), linked_user_ids)
+
+                # upsert teams
+                teams_by_jira_id, created = _upsert_teams(
+                    db, team_field_id, [t for _, issue_teams in parsed for t in issue_teams], known_teams
                 )
-                if team is None:
-                    team = Team(jira_field_id=team_field_id, jira_team_id=jira_team_id, name=name)
-                    db.add(team)
-                    db.flush()
-                    created_teams += 1
-                else:
-                    team.name = name
-                    # Обновляем имя команды, если изменилось
-                    db.flush()
+                created_teams += created
+                seen_team_ids.update(teams_by_jira_id.values())
 
                 # привязка team к credential (изоляция)
-                ct = db.scalar(
-                    select(CredentialTeam).where(
-                        CredentialTeam.credential_id == credential_id,
-                        CredentialTeam.team_id == team.id,
-                    )
+                new_team_ids = [team_id for team_id in teams_by_jira_id.values() if team_id not in linked_team_ids]
+                _insert_on_conflict(
+                    db,
+                    CredentialTeam,
+                    [{"credential_id": credential_id, "team_id": team_id} for team_id in new_team_ids],
+                    index_elements=["credential_id", "team_id"],
                 )
-                if ct is None:
-                    db.add(CredentialTeam(credential_id=credential_id, team_id=team.id))
-
-                # связываем пользователей с командами (проверяем дубликаты в БД и в рамках задачи)
-                seen_in_issue: set[int] = set()
-                for user in issue_users:
-                    if user.id in seen_in_issue:
-                        continue  # уже добавили этого пользователя для этой команды в этой задаче
-                    exists = db.scalar(
-                        select(TeamMember).where(TeamMember.team_id == team.id, TeamMember.user_id == user.id)
-                    )
-                    if exists is None:
-                        db.add(TeamMember(team_id=team.id, user_id=user.id))
-                        created_links += 1
-                        seen_in_issue.add(user.id)
+                linked_team_ids.update(new_team_ids)
 
-        next_token = (data.get("nextPageToken") or "").strip()
-        if not next_token:
-            break
+                # связываем пользователей с командами
+                unseen_team_ids = [team_id for team_id in teams_by_jira_id.values() if team_id not in members_by_team]
+                if unseen_team_ids:
+                    for team_id in unseen_team_ids:
+                        members_by_team[team_id] = set()
+                    for team_id, user_id in db.execute(
+                        select(TeamMember.team_id, TeamMember.user_id).where(TeamMember.team_id.in_(unseen_team_ids))
+                    ).tuples():
+                        members_by_team[team_id].add(user_id)
+                tm_rows: List[dict] = []
+                for issue_users, issue_teams in parsed:
+                    for jira_team_id, _ in issue_teams:
+                        team_id = teams_by_jira_id[jira_team_id]
+                        members = members_by_team[team_id]
+                        for nu in issue_users:
+                            user_id = users_by_acct[nu["accountId"]]
+                            if user_id in members:
+                                continue
+                            members.add(user_id)
+                            tm_rows.append({"team_id": team_id, "user_id": user_id})
+                _insert_on_conflict(db, TeamMember, tm_rows, index_elements=["team_id", "user_id"])
+                created_links += len(tm_rows)
 
-    # Синхронизируем всех пользователей Jira, если включено
-    if sync_all_users:
-        try:
-            users_count = sync_all_jira_users(jira, api_prefix, db, credential_id=credential_id)
-            print(f"Synced {users_count} additional users from Jira API")
-            created_users += users_count
-        except Exception as e:
-            print(f"Warning: Failed to sync all users: {e}")
+                pages_done += 1
+                if pages_done % SYNC_COMMIT_EVERY_PAGES == 0:
+                    db.commit()
+
+                if next_page is None:
+                    break
+                data, page_size = next_page.result()
 
-    db.commit()
+        # Синхронизируем всех пользователей Jira, если включено
+        if sync_all_users:
+            try:
+                users_count = sync_all_jira_users(
+                    jira,
+                    api_prefix,
+                    db,
+                    credential_id=credential_id,
+                    linked_user_ids=linked_user_ids,
+                    known_users=known_users,
+                    seen_user_ids=seen_user_ids,
+                )
+                print(f"Synced {users_count} additional users from Jira API")
+                created_users += users_count
+            except Exception as e:
+                print(f"Warning: Failed to sync all users: {e}")
+
+        # Важно: чистим связи только после успешного sync (мы дошли сюда без исключения).
+        # Иначе при временной ошибке/особенностях Jira можно потерять доступ к уже
+        # синхронизированным командам.
+        _delete_stale_links(db, CredentialTeam.team_id, credential_id, stale_team_ids - seen_team_ids)
+        _delete_stale_links(db, CredentialUser.user_id, credential_id, stale_user_ids - seen_user_ids)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     return {"teams_created": created_teams, "users_created": created_users, "links_created": created_links}
 
 
@@ -272,15 +603,32 @@ def credential_has_any_team(
 ) -> bool:
     """
     Проверка для авторизации: есть ли хотя бы одна команда, доступная по ключу.
+    Ответ кэшируется на HAS_TEAM_CACHE_TTL_S по (base_url, хэш Authorization, api_prefix, поле),
+    чтобы повторные проверки не ходили в Jira.
     """
-    fields = jira.get_fields(api_prefix)
-    team_field_id = find_field_id(fields, team_field_name)
+    auth_hash = hashlib.sha256((jira.session.headers.get("Authorization") or "").encode("utf-8")).hexdigest()
+    cache_key = (jira.base_url, auth_hash, api_prefix, team_field_name)
+    cached = _HAS_TEAM_CACHE.get(cache_key)
+    if cached is not None and time.time() - cached[0] < HAS_TEAM_CACHE_TTL_S:
+        return cached[1]
+
+    team_field_id = jira.get_field_id(api_prefix, team_field_name)
     jql = f'"{team_field_id}" is not EMPTY'
+    # Нужна одна задача и только поле команды: enhanced search (/search/jql) не отдает total,
+    # поэтому maxResults=0 ничего бы не сказал
     data = jira.search_jql_page(jql=jql, fields=[team_field_id], max_results=1, next_page_token="")
     issues = data.get("issues", []) or data.get("values", [])
-    for issue in issues:
-        f = issue.get("fields", {})
-        teams = extract_team_values(f.get(team_field_id))
-        if teams:
-            return True
-    return False
+    has_team = any(extract_team_values(issue.get("fields", {}).get(team_field_id)) for issue in issues)
+    now = time.time()
+    with _HAS_TEAM_CACHE_LOCK:
+        if len(_HAS_TEAM_CACHE) >= HAS_TEAM_CACHE_MAX:
+            expired = [k for k, (ts, _) in _HAS_TEAM_CACHE.items() if now - ts >= HAS_TEAM_CACHE_TTL_S]
+            for k in expired:
+                del _HAS_TEAM_CACHE[k]
+            # Все еще переполнен — вытесняем самые старые записи (dict хранит порядок вставки)
+            overflow = len(_HAS_TEAM_CACHE) + 1 - HAS_TEAM_CACHE_MAX
+            for k in list(_HAS_TEAM_CACHE)[: max(overflow, 0)]:
+                del _HAS_TEAM_CACHE[k]
+        _HAS_TEAM_CACHE.pop(cache_key, None)
+        _HAS_TEAM_CACHE[cache_key] = (now, has_team)
+    return has_team
@@ -1,17 +1,36 @@
 from __future__ import annotations
 
+import json
 import time
 from typing import Any
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .config import settings
 
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+# Одна сессия на процесс: keep-alive к api.telegram.org вместо нового TCP+TLS на каждое сообщение.
+# Ретраи остаются в цикле send_message, у адаптера их нет.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0))
+
 
 class TelegramNotifierError(RuntimeError):
     pass
 
 
+def _dumps(payload: dict[str, Any]) -> bytes:
+    # Тело отправляем готовыми UTF-8 байтами: без \uXXXX-экранирования кириллицы оно вдвое короче
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
 def _build_send_message_url(bot_token: str) -> str:
     base = settings.telegram_api_base_url.rstrip("/")
     return f"{base}/bot{bot_token}/sendMessage"
@@ -31,13 +50,15 @@ def send_message(chat_id: str, text: str, *, disable_notification: bool = False,
         "disable_notification": disable_notification,
     }
 
+    body = _dumps(payload)
+    headers = {"Content-Type": "application/json"}
     url = _build_send_message_url(bot_token)
     timeout = (settings.telegram_connect_timeout_seconds, settings.telegram_read_timeout_seconds)
     last_error: Exception | None = None
 
     for attempt in range(1, max(retries, 1) + 1):
         try:
-            response = requests.post(url, json=payload, timeout=timeout)
+            response = _session.post(url, data=body, headers=headers, timeout=timeout)
             if response.status_code >= 400:
                 raise TelegramNotifierError(
                     f"Telegram API HTTP {response.status_code}: {response.text[:300]}"
@@ -3,21 +3,35 @@
 """
 from __future__ import annotations
 
+import copy
+from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Dict, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from operator import attrgetter
+from typing import Callable, Dict, Iterator, List
+from concurrent.futures import Future, ThreadPoolExecutor
 import time
 import math
 import re
 import os
+import threading
+from urllib.parse import urlsplit
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import or_, select
 
 from .config import settings
-from .jira_client import Jira, build_headers_from_env, find_field_id, load_env_file
+from .jira_client import JIRA_POOL_MAXSIZE, Jira, build_headers_from_env, load_env_file, response_json
 from .models import ApiCredential, CredentialTeam, CredentialUser, CustomTeam, Team, TeamConfig, TeamMember, User
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Регулярки горячих циклов разбора worklog'ов компилируем один раз
+_ISSUE_KEY_RE = re.compile(r"[A-Z][A-Z0-9]+-\d+")
+_WORKLOG_SELF_ISSUE_RE = re.compile(r"/issue/([^/]+)/worklog")
+_TEAMBOARD_INVALID_USERS_RE = re.compile(r"Invalid user accounts:\s*(.+)$", re.IGNORECASE)
 
 
 def _comment_to_text(comment) -> str:
@@ -30,27 +44,27 @@ def _comment_to_text(comment) -> str:
     if isinstance(comment, str):
         return comment
 
+    # Обход ADF (doc/content/text) явным стеком в порядке документа: без рекурсии,
+    # каждый text strip'аем один раз и сразу отбрасываем пустые
     texts: list[str] = []
-
-    def walk(node) -> None:
-        if node is None:
-            return
+    found_text = False
+    stack = [comment]
+    while stack:
+        node = stack.pop()
         if isinstance(node, dict):
-            t = node.get("type")
-            if t == "text" and isinstance(node.get("text"), str):
-                texts.append(node["text"])
-            for child in (node.get("content") or []):
-                walk(child)
-            return
-        if isinstance(node, list):
-            for child in node:
-                walk(child)
-            return
-
-    # Попробуем разобрать ADF (doc/content/text)
-    walk(comment)
-    if texts:
-        return " ".join(t.strip() for t in texts if t and t.strip()).strip()
+            text = node.get("text")
+            if isinstance(text, str) and node.get("type") == "text":
+                found_text = True
+                text = text.strip()
+                if text:
+                    texts.append(text)
+            children = node.get("content")
+            if children:
+                stack.extend(reversed(children))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    if found_text:
+        return " ".join(texts)
 
     # Fallback — привести к строке (чтобы JS substring не падал)
     try:
@@ -65,12 +79,19 @@ def _coerce_issue_id(value) -> int | None:
     if isinstance(value, int):
         return value
     if isinstance(value, str):
-        s = value.strip()
-        if s.isdigit():
-            try:
-                return int(s)
-            except Exception:
-                return None
+        return _parse_issue_id(value)
+    return None
+
+@lru_cache(maxsize=4096)
+def _parse_issue_id(value: str) -> int | None:
+    # Один и тот же issueId повторяется во всех worklog'ах задачи — разбираем строку один раз.
+    # Кэш только для str: из интеграций issueId может прийти dict/list, а они не хэшируются.
+    s = value.strip()
+    if s.isdigit():
+        try:
+            return int(s)
+        except Exception:
+            return None
     return None
 
 def _coerce_issue_key(value) -> str:
@@ -80,7 +101,7 @@ def _coerce_issue_key(value) -> str:
     if not isinstance(value, str):
         return ""
     s = value.strip().upper()
-    if re.fullmatch(r"[A-Z][A-Z0-9]+-\d+", s):
+    if _ISSUE_KEY_RE.fullmatch(s):
         return s
     return ""
 
@@ -88,17 +109,22 @@ def _extract_issue_ref_from_worklog(worklog: dict) -> tuple[int | None, str]:
     """
     Пытается извлечь issueId/issueKey из worklog Jira в разных форматах.
     """
-    # 1) Прямые поля
-    issue_id = (
-        _coerce_issue_id(worklog.get("issueId"))
-        or _coerce_issue_id(worklog.get("issueID"))
-        or _coerce_issue_id(worklog.get("issue_id"))
-    )
-    issue_key = (
-        _coerce_issue_key(worklog.get("issueKey"))
-        or _coerce_issue_key(worklog.get("issue"))
-        or _coerce_issue_key(worklog.get("key"))
-    )
+    # 1) Прямые поля — по первому непустому; отсутствующие поля не разбираем вовсе.
+    # В ответе /worklog/list обычно есть только issueId, остальные имена — для интеграций.
+    get = worklog.get
+    issue_id = None
+    for name in ("issueId", "issueID", "issue_id"):
+        value = get(name)
+        issue_id = None if value is None else _coerce_issue_id(value)
+        if issue_id:
+            break
+    issue_key = ""
+    for name in ("issueKey", "issue", "key"):
+        value = get(name)
+        if isinstance(value, str):
+            issue_key = _coerce_issue_key(value)
+            if issue_key:
+                break
 
     # 2) Вложенный объект issue (если вдруг приходит)
     issue_obj = worklog.get("issue")
@@ -115,7 +141,7 @@ def _extract_issue_ref_from_worklog(worklog: dict) -> tuple[int | None, str]:
     if issue_id is None and not issue_key:
         self_url = str(worklog.get("self") or "").strip()
         if self_url:
-            m = re.search(r"/issue/([^/]+)/worklog", self_url)
+            m = _WORKLOG_SELF_ISSUE_RE.search(self_url)
             if m:
                 ref = (m.group(1) or "").strip()
                 maybe_id = _coerce_issue_id(ref)
@@ -126,19 +152,305 @@ def _extract_issue_ref_from_worklog(worklog: dict) -> tuple[int | None, str]:
 
     return issue_id, issue_key
 
+# Сколько ссылок на задачи кладем в один JQL `issue in (...)` — держим запрос в пределах лимита длины JQL
+ISSUE_META_JQL_CHUNK = 100
+# key+summary задач между вызовами: окно в N дней сдвигается медленно, и задачи повторяются
+# от запроса к запросу. {(base_url, issueId|issueKey): (ts, (key, summary))}
+ISSUE_META_CACHE_TTL_S = 600
+ISSUE_META_CACHE_MAX = 20_000
+_ISSUE_META_CACHE: Dict[tuple[str, int | str], tuple[float, tuple[str, str]]] = {}
+_ISSUE_META_CACHE_LOCK = threading.Lock()
+# Авторов в одном `worklogAuthor in (...)` и предел страниц такого поиска (legacy-путь worklog)
+WORKLOG_AUTHOR_JQL_CHUNK = 50
+WORKLOG_AUTHOR_MAX_PAGES = 25
+# id worklog'ов в одном POST /worklog/list — больше Jira не принимает
+WORKLOG_LIST_CHUNK = 1000
+# Предохранитель legacy-пути: больше задач по одному запросу worklog не обходим
+WORKLOG_MAX_ISSUES = 50_000
+# Кэш готового ответа get_team_worklog: {ключ запроса: (ts, агрегаты пользователей, debug sources)}.
+# Наружу агрегаты не отдаются — каждый ответ собирается из них заново через to_dict, так что
+# вызывающий код может менять полученные dict'ы, не портя кэш. Просроченное вычищается при записи.
+WL_CACHE_TTL_S = 60
+WL_CACHE_MAX = 256
+_WL_CACHE: Dict[tuple, tuple[float, List["_UserWorklog"], Dict]] = {}
+_WL_CACHE_LOCK = threading.Lock()
+# Общие на процесс пулы потоков вместо пула на каждый вызов get_team_worklog:
+# - _JIRA_EXECUTOR — загрузка worklog'ов по задачам (legacy-путь). По умолчанию потоков столько же,
+#   сколько соединений в пуле сессии Jira — ни один не ждет свободного соединения; под лимиты
+#   конкретной Jira уменьшается через PLANNIG_WORKLOG_WORKERS (settings.worklog_max_workers),
+#   но не выше JIRA_POOL_MAXSIZE: лишние потоки только ждали бы соединение или открывали одноразовые;
+# - _BACKGROUND_EXECUTOR — фоновые запросы DevSamurai/Teamboard и упреждающая загрузка /worklog/list.
+# Задачи в пулах не ждут друг друга, поэтому общая очередь не может зависнуть.
+_JIRA_EXECUTOR = ThreadPoolExecutor(
+    max_workers=min(settings.worklog_max_workers, JIRA_POOL_MAXSIZE) if settings.worklog_max_workers > 0 else JIRA_POOL_MAXSIZE,
+    thread_name_prefix="worklog-jira",
+)
+_BACKGROUND_EXECUTOR = ThreadPoolExecutor(max_workers=JIRA_POOL_MAXSIZE, thread_name_prefix="worklog-bg")
+# Аккаунты, которые Teamboard отверг как "Invalid user accounts", по base_url: следующие
+# запросы сразу идут без них, а не получают 403 и повтор той же страницы
+TEAMBOARD_INVALID_USERS_TTL_S = 3600
+_TEAMBOARD_INVALID_USERS: Dict[str, tuple[float, set[str]]] = {}
+# Выполняющиеся сейчас сборы по тому же ключу: {ключ: Future[(result, debug sources)]}
+_WL_INFLIGHT: Dict[tuple, Future] = {}
+_WL_INFLIGHT_LOCK = threading.Lock()
+
+
+
+@dataclass(slots=True)
+class _WorklogEntry:
+    """Одно списание в ответе get_team_worklog (в dict превращается только при выдаче)."""
+
+    issue_key: str
+    issue_summary: str
+    started: str | None
+    worklog_date: str | None
+    time_spent_seconds: int
+    time_spent: str
+    comment: str
+
+    def to_dict(self) -> Dict:
+        return {
+            "issue_key": self.issue_key,
+            "issue_summary": self.issue_summary,
+            "started": self.started,
+            "worklog_date": self.worklog_date,
+            "time_spent_seconds": self.time_spent_seconds,
+            "time_spent": self.time_spent,
+            "comment": self.comment,
+        }
+
+
+@dataclass(slots=True)
+class _UserWorklog:
+    """Агрегат списаний пользователя; total_hours считается при выдаче."""
+
+    user_id: int
+    user_name: str
+    user_account_id: str
+    total_seconds: int = 0
+    entries: List[_WorklogEntry] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "user_name": self.user_name,
+            "user_account_id": self.user_account_id,
+            "total_seconds": self.total_seconds,
+            "total_hours": self.total_seconds / 3600.0,
+            # entries уже отсортированы в конце _collect_team_worklog
+            "entries": [e.to_dict() for e in self.entries],
+        }
+
+
+@lru_cache(maxsize=1024)
+def _seconds_to_human(seconds: int) -> str:
+    """Jira-стиль "1h 30m". Длительности событий сильно повторяются, поэтому результат мемоизирован."""
+    if seconds <= 0:
+        return ""
+    m = int(round(seconds / 60.0))
+    h = m // 60
+    mm = m % 60
+    if h and mm:
+        return f"{h}h {mm}m"
+    if h:
+        return f"{h}h"
+    return f"{mm}m"
+
+
+def _whole_day(day: datetime) -> tuple[datetime, datetime]:
+    """Окно на весь календарный день: 00:00:00 .. 23:59:59."""
+    start = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start.replace(hour=23, minute=59, second=59)
+
+
+def _previous_workday(now: datetime) -> datetime:
+    """Последний рабочий день перед текущей датой: Пн -> Пт, Вт -> Пн, Вс -> Пт и т.д."""
+    previous_day = now - timedelta(days=1)
+    while previous_day.weekday() >= 5:  # 5=Saturday, 6=Sunday
+        previous_day -= timedelta(days=1)
+    return previous_day
+
+
+# Именованные режимы days -> (start_date, end_date) от текущего момента
+_DAY_WINDOWS: Dict[str, Callable[[datetime], tuple[datetime, datetime]]] = {
+    "previous_workday": lambda now: _whole_day(_previous_workday(now)),
+    "today": _whole_day,
+    "yesterday": lambda now: _whole_day(now - timedelta(days=1)),
+}
+
+
+def _worklog_window(days: str | int, now: datetime) -> tuple[datetime, datetime]:
+    """
+    Окно дат для get_team_worklog: именованный режим из _DAY_WINDOWS
+    либо последние N дней (по умолчанию 8) до текущего момента.
+    """
+    window = _DAY_WINDOWS.get(days) if isinstance(days, str) else None
+    if window is not None:
+        return window(now)
+    days_int = int(days) if isinstance(days, str) else days
+    return now - timedelta(days=days_int), now
+
+def _fetch_issue_meta_batch(
+    jira: Jira, api_prefix: str, refs: List[int | str]
+) -> tuple[Dict[int, tuple[str, str]], Dict[str, tuple[str, str]]]:
+    """
+    key+summary для набора задач (issueId или issueKey) пачками через JQL `issue in (...)`
+    вместо GET /issue/{ref} на каждую задачу. Каждая найденная задача попадает в обе мапы.
+    Если Jira отвергла пачку (например, задачу удалили и ключа больше нет), делим пачку
+    пополам и повторяем — битая ссылка стоит O(log n) поисков, а поштучный GET остается
+    только для нее самой. Найденное кэшируется на ISSUE_META_CACHE_TTL_S по (base_url, ссылка).
+    Возвращает ({issueId: (key, summary)}, {issueKey: (key, summary)}).
+    """
+    by_id: Dict[int, tuple[str, str]] = {}
+    by_key: Dict[str, tuple[str, str]] = {}
+
+    # Что уже есть в кэше — отдаем сразу, в JQL идут только недостающие ссылки
+    now = time.time()
+    missing: List[int | str] = []
+    for ref in refs:
+        cached = _ISSUE_META_CACHE.get((jira.base_url, ref))
+        if cached is not None and now - cached[0] < ISSUE_META_CACHE_TTL_S:
+            if isinstance(ref, int):
+                by_id[ref] = cached[1]
+            else:
+                by_key[ref] = cached[1]
+        else:
+            missing.append(ref)
+    found: Dict[int | str, tuple[str, str]] = {}
+
+    def search(chunk: List[int | str]) -> List[tuple[str, int | None, tuple[str, str]]]:
+        # Только сетевой запрос и разбор — без записи в общие мапы, чтобы пачки шли параллельно
+        hits: List[tuple[str, int | None, tuple[str, str]]] = []
+        jql = f"issue in ({', '.join(str(ref) for ref in chunk)})"
+        next_token = ""
+        while True:
+            data = jira.search_jql_page(jql=jql, fields=["summary"], max_results=ISSUE_META_JQL_CHUNK, next_page_token=next_token)
+            for issue in data.get("issues", []) or []:
+                key = (issue.get("key") or "").strip()
+                if key:
+                    hits.append((key, _coerce_issue_id(issue.get("id")), (key, (issue.get("fields") or {}).get("summary") or key)))
+            next_token = (data.get("nextPageToken") or "").strip()
+            if not next_token:
+                return hits
+
+    def record(hits: List[tuple[str, int | None, tuple[str, str]]]) -> None:
+        for key, iid, meta in hits:
+            by_key[key] = meta
+            found[key] = meta
+            if iid is not None:
+                by_id[iid] = meta
+                found[iid] = meta
+
+    chunks = [missing[i : i + ISSUE_META_JQL_CHUNK] for i in range(0, len(missing), ISSUE_META_JQL_CHUNK)]
+    pending: List[List[int | str]] = []
+    if len(chunks) > 1:
+        # Первый проход — все пачки параллельно на общем пуле; отвергнутые уходят в деление ниже.
+        # Вызывающий поток сам в пуле не сидит, так что ожидание результатов не блокирует пул.
+        futures = [_JIRA_EXECUTOR.submit(search, chunk) for chunk in chunks]
+        for chunk, fut in zip(chunks, futures):
+            try:
+                record(fut.result())
+            except Exception:
+                pending.append(chunk)
+    else:
+        pending = chunks
+    while pending:
+        chunk = pending.pop()
+        try:
+            record(search(chunk))
+            continue
+        except Exception as e:
+            if len(chunk) > 1:
+                mid = len(chunk) // 2
+                pending.extend((chunk[:mid], chunk[mid:]))
+                continue
+            print(f"Warning: batched issue lookup failed, fallback to per-issue: {e}")
+        ref = chunk[0]
+        if ref in by_id or ref in by_key:
+            continue
+        meta = _fetch_issue_key_summary(jira, api_prefix, ref)
+        if meta is None:
+            meta = (str(ref), str(ref))
+        else:
+            found[ref] = meta
+        if isinstance(ref, int):
+            by_id[ref] = meta
+        else:
+            by_key[ref] = meta
+
+    # Кэшируем только реально найденное: заглушка (ref, ref) после неудачного GET в кэш не попадает
+    if found:
+        with _ISSUE_META_CACHE_LOCK:
+            if len(_ISSUE_META_CACHE) + len(found) > ISSUE_META_CACHE_MAX:
+                expired = [k for k, (ts, _) in _ISSUE_META_CACHE.items() if now - ts >= ISSUE_META_CACHE_TTL_S]
+                for k in expired:
+                    del _ISSUE_META_CACHE[k]
+                # Все еще переполнен — вытесняем самые старые записи (dict хранит порядок вставки)
+                overflow = len(_ISSUE_META_CACHE) + len(found) - ISSUE_META_CACHE_MAX
+                for k in list(_ISSUE_META_CACHE)[: max(overflow, 0)]:
+                    del _ISSUE_META_CACHE[k]
+            for ref, meta in found.items():
+                _ISSUE_META_CACHE.pop((jira.base_url, ref), None)
+                _ISSUE_META_CACHE[(jira.base_url, ref)] = (now, meta)
+    return by_id, by_key
+
+
+def _fetch_issue_key_summary(jira: Jira, api_prefix: str, issue_ref: int | str) -> tuple[str, str] | None:
+    """
+    Получить key+summary по issueId или issueKey. None, если Jira задачу не отдала.
+    """
+    try:
+        r = jira.request("GET", f"{api_prefix}/issue/{issue_ref}?fields=summary")
+        if r.status_code == 200:
+            j = r.json()
+            key = (j.get("key") or "").strip()
+            fallback = str(issue_ref)
+            return (
+                key or fallback,
+                (j.get("fields", {}) or {}).get("summary") or key or fallback,
+            )
+    except Exception:
+        pass
+    return None
+
+
 def _make_http_session_for_integrations() -> requests.Session:
     """
     HTTP-сессия для внешних интеграций (Teamboard/DevSamurai).
     По умолчанию НЕ использует системные proxy-переменные, чтобы локально не падать с WinError 10061.
+    Keep-alive пул и повторы на 429/502/503/504 (ответ с ошибкой возвращается как есть).
     """
     s = requests.Session()
     use_system_proxy = (os.getenv("WORKLOG_USE_SYSTEM_PROXY") or "").strip().lower() in ("1", "true", "yes", "on")
     s.trust_env = use_system_proxy
     if not use_system_proxy:
         s.proxies = {}
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504), raise_on_status=False),
+    )
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
     return s
 
 
+# Одна сессия на хост интеграции на процесс: Teamboard-пагинация и повторные вызовы
+# get_team_worklog переиспользуют keep-alive соединения вместо нового TCP+TLS на каждый вызов
+_INTEGRATION_SESSIONS: Dict[str, requests.Session] = {}
+_INTEGRATION_SESSIONS_LOCK = threading.Lock()
+
+
+def _integration_session(url: str) -> requests.Session:
+    host = urlsplit(url).netloc
+    with _INTEGRATION_SESSIONS_LOCK:
+        session = _INTEGRATION_SESSIONS.get(host)
+        if session is None:
+            session = _make_http_session_for_integrations()
+            _INTEGRATION_SESSIONS[host] = session
+        return session
+
+
 def get_team_worklog(
     db: Session,
     team_id: int,
@@ -166,27 +478,32 @@ def get_team_worklog(
     """
     # Для Jira-команд нужен объект Team (jira_team_id используется в fallback-логике).
     # Для custom-команд работаем по TeamConfig и Team не требуется.
-    team = None if is_custom else db.get(Team, team_id)
-    if not is_custom and not team:
-        return []
-
     # Ограничиваем доступ к команде.
     # Приоритет у app_user_id (устойчиво при ротации/пересоздании credential).
-    if app_user_id is not None:
-        if is_custom:
-            allowed = db.scalar(
-                select(CustomTeam.id).where(
-                    CustomTeam.app_user_id == app_user_id,
-                    CustomTeam.id == team_id,
-                )
-            )
-        else:
-            allowed = db.scalar(
-                select(Team.id)
-                .join(CredentialTeam, CredentialTeam.team_id == Team.id)
+    # Для Jira-команды загрузка Team и проверка доступа — один запрос.
+    team = None
+    if not is_custom:
+        team_q = select(Team).where(Team.id == team_id)
+        if app_user_id is not None:
+            team_q = (
+                team_q.join(CredentialTeam, CredentialTeam.team_id == Team.id)
                 .join(ApiCredential, ApiCredential.id == CredentialTeam.credential_id)
-                .where(ApiCredential.app_user_id == app_user_id, Team.id == team_id)
+                .where(ApiCredential.app_user_id == app_user_id)
+            )
+        elif credential_id is not None:
+            team_q = team_q.join(CredentialTeam, CredentialTeam.team_id == Team.id).where(
+                CredentialTeam.credential_id == credential_id
             )
+        team = db.scalars(team_q.limit(1)).first()
+        if team is None:
+            return []
+    elif app_user_id is not None:
+        allowed = db.scalar(
+            select(CustomTeam.id).where(
+                CustomTeam.app_user_id == app_user_id,
+                CustomTeam.id == team_id,
+            )
+        )
         if allowed is None:
             return []
     elif credential_id is not None:
@@ -196,56 +513,168 @@ def get_team_worklog(
         if allowed is None:
             return []
 
-    if app_user_id is not None:
-        # Приоритет: персональный состав команды из TeamConfig.
-        user_ids = set(
-            db.scalars(
-                select(TeamConfig.jira_user_id).where(
-                    TeamConfig.app_user_id == app_user_id,
-                    TeamConfig.team_id == team_id,
-                    TeamConfig.is_custom == is_custom,
-                )
-            ).all()
-        )
-        # Мягкий fallback на старую модель, чтобы исторические настройки не "пропадали"
-        # до первого сохранения через новую логику.
-        if not user_ids and not is_custom:
-            members = db.query(TeamMember).filter(TeamMember.team_id == team_id).all()
-            user_ids = {m.user_id for m in members}
-    else:
-        # Fallback на общий состав команды
-        members = db.query(TeamMember).filter(TeamMember.team_id == team_id).all()
-        user_ids = {m.user_id for m in members}
+    # Вычисляем даты в зависимости от параметра days
+    start_date, end_date = _worklog_window(days, datetime.now())
+    start_date_str = start_date.strftime("%Y-%m-%d")
+    end_date_str = end_date.strftime("%Y-%m-%d")
 
-    if not user_ids:
-        return []
+    # Повторный запрос той же команды за то же окно в пределах TTL отдаем из кэша.
+    # Ключ включает и того, кто спрашивает: состав и фильтр пользователей зависят от app_user/credential.
+    cache_key = (
+        team_id,
+        is_custom,
+        str(days),
+        start_date_str,
+        end_date_str,
+        credential_id,
+        app_user_id,
+        team_field_name,
+        jira.base_url if jira is not None else None,
+    )
+    cached = _WL_CACHE.get(cache_key)
+    if cached and (time.time() - cached[0]) < WL_CACHE_TTL_S:
+        if debug_out is not None:
+            debug_out.setdefault("sources", {}).update(copy.deepcopy(cached[2]))
+        return [u.to_dict() for u in cached[1]]
+
+    # Одинаковый запрос, пришедший, пока такой же еще выполняется (несколько вкладок/клиентов
+    # дашборда), не запускает второй сбор: ждем результат первого
+    with _WL_INFLIGHT_LOCK:
+        inflight = _WL_INFLIGHT.get(cache_key)
+        if inflight is None:
+            leader: Future = Future()
+            _WL_INFLIGHT[cache_key] = leader
+    if inflight is not None:
+        users, sources = inflight.result()
+        if debug_out is not None:
+            debug_out.setdefault("sources", {}).update(copy.deepcopy(sources))
+        return [u.to_dict() for u in users]
+
+    if debug_out is None:
+        debug_out = {}
+    debug_out.setdefault("sources", {})
+    try:
+        users = _collect_team_worklog(
+            db,
+            team,
+            team_id,
+            start_date,
+            end_date,
+            team_field_name=team_field_name,
+            jira=jira,
+            api_prefix=api_prefix,
+            credential_id=credential_id,
+            app_user_id=app_user_id,
+            is_custom=is_custom,
+            debug_out=debug_out,
+        )
+        # Сначала кэш и результат, и только потом снимаем запись из _WL_INFLIGHT: иначе запрос,
+        # пришедший в этот промежуток, не нашел бы ни Future, ни кэша и запустил второй сбор
+        sources = copy.deepcopy(debug_out["sources"])
+        _store_worklog_cache(cache_key, users, sources)
+        leader.set_result((users, sources))
+    except BaseException as e:
+        if not leader.done():
+            leader.set_exception(e)
+        raise
+    finally:
+        with _WL_INFLIGHT_LOCK:
+            _WL_INFLIGHT.pop(cache_key, None)
+    return [u.to_dict() for u in users]
+
+
+def _store_worklog_cache(cache_key: tuple, users: List[_UserWorklog], sources: Dict) -> None:
+    """Запись в _WL_CACHE с вычисткой просроченного и потолком WL_CACHE_MAX (как у _ISSUE_META_CACHE)."""
+    now = time.time()
+    with _WL_CACHE_LOCK:
+        if len(_WL_CACHE) >= WL_CACHE_MAX:
+            expired = [k for k, (ts, _, _) in _WL_CACHE.items() if now - ts >= WL_CACHE_TTL_S]
+            for k in expired:
+                del _WL_CACHE[k]
+            # Все еще переполнен — вытесняем самые старые записи (dict хранит порядок вставки)
+            overflow = len(_WL_CACHE) + 1 - WL_CACHE_MAX
+            for k in list(_WL_CACHE)[: max(overflow, 0)]:
+                del _WL_CACHE[k]
+        _WL_CACHE.pop(cache_key, None)
+        _WL_CACHE[cache_key] = (now, users, sources)
+
+
+def _collect_team_worklog(
+    db: Session,
+    team: Team | None,
+    team_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    *,
+    team_field_name: str,
+    jira: "Jira | None",
+    api_prefix: str | None,
+    credential_id: int | None,
+    app_user_id: int | None,
+    is_custom: bool,
+    debug_out: dict,
+) -> List[_UserWorklog]:
+    """
+    Сбор worklog'ов команды за окно [start_date, end_date] для get_team_worklog
+    (доступ к команде уже проверен, кэш и дедупликация одновременных запросов — снаружи).
+    Возвращает агрегаты в порядке выдачи; в dict их превращает get_team_worklog.
+    """
+    start_date_str = start_date.strftime("%Y-%m-%d")
+    end_date_str = end_date.strftime("%Y-%m-%d")
 
-    # Фильтруем по доступности через credentials пользователя (если передан app_user_id или credential_id)
-    filter_user_ids = None
+    # Фильтруем по доступности через credentials пользователя (если передан app_user_id или credential_id).
+    # Фильтр — подзапросом в том же SELECT, что и состав команды, без отдельной выборки id.
+    credential_user_ids = None
     if app_user_id is not None:
-        filter_user_ids = set(db.scalars(
+        credential_user_ids = (
             select(CredentialUser.user_id)
             .join(ApiCredential, ApiCredential.id == CredentialUser.credential_id)
             .where(ApiCredential.app_user_id == app_user_id)
-        ).all())
+        )
     elif credential_id is not None:
-        filter_user_ids = set(db.scalars(
-            select(CredentialUser.user_id).where(CredentialUser.credential_id == credential_id)
-        ).all())
+        credential_user_ids = select(CredentialUser.user_id).where(CredentialUser.credential_id == credential_id)
 
-    if filter_user_ids is not None:
+    def accessible(users_q):
+        if credential_user_ids is None:
+            return users_q
         # Если список credential_users временно пустой/рассинхронизирован,
         # не "обнуляем" выдачу: оставляем пользователей команды.
-        if len(filter_user_ids) == 0:
-            filter_user_ids = None
-
-    if filter_user_ids is not None:
-        user_ids = user_ids.intersection(filter_user_ids)
-        if not user_ids:
-            return []
+        return users_q.where(or_(~credential_user_ids.exists(), User.id.in_(credential_user_ids)))
+
+    def load_users(users_q) -> list:
+        # Нужны только id/accountId/имя: берем строки-кортежи (row.id и т.д.) без ORM-гидрации.
+        # JOIN может повторить пользователя — оставляем первое вхождение.
+        rows = db.execute(accessible(users_q)).all()
+        return list({row.id: row for row in rows}.values())
+
+    # Состав команды сразу вместе с пользователями: один JOIN вместо выборки id и затем User IN (...)
+    user_columns = (User.id, User.jira_account_id, User.display_name)
+    team_member_users = (
+        select(*user_columns).join(TeamMember, TeamMember.user_id == User.id).where(TeamMember.team_id == team_id)
+    )
+    if app_user_id is not None:
+        # Приоритет: персональный состав команды из TeamConfig.
+        team_config_users = (
+            select(*user_columns)
+            .join(TeamConfig, TeamConfig.jira_user_id == User.id)
+            .where(
+                TeamConfig.app_user_id == app_user_id,
+                TeamConfig.team_id == team_id,
+                TeamConfig.is_custom == is_custom,
+            )
+        )
+        users = load_users(team_config_users)
+        # Мягкий fallback на старую модель, чтобы исторические настройки не "пропадали"
+        # до первого сохранения через новую логику. Пустой результат мог дать и фильтр
+        # доступности, поэтому fallback — только если персонального состава нет вовсе.
+        if not users and not is_custom and not db.scalar(select(team_config_users.exists())):
+            users = load_users(team_member_users)
+    else:
+        # Fallback на общий состав команды
+        users = load_users(team_member_users)
 
-    users = db.query(User).filter(User.id.in_(user_ids)).all()
-    user_by_account_id: Dict[str, User] = {u.jira_account_id: u for u in users if u.jira_account_id}
+    if not users:
+        return []
 
     # Подключаемся к Jira (если не передан клиент)
     if jira is None or api_prefix is None:
@@ -254,54 +683,8 @@ def get_team_worklog(
         jira = Jira(base_url, headers)
         api_prefix = jira.detect_api_prefix()
 
-    # Получаем поле TEAM
-    fields = jira.get_fields(api_prefix)
-    team_field_id = find_field_id(fields, team_field_name)
-
-    # Вычисляем даты в зависимости от параметра days
-    now = datetime.now()
-    if days == "previous_workday":
-        # Ищем последний рабочий день перед текущей датой.
-        # Пн -> Пт, Вт -> Пн, Вс -> Пт и т.д.
-        previous_day = now - timedelta(days=1)
-        while previous_day.weekday() >= 5:  # 5=Saturday, 6=Sunday
-            previous_day -= timedelta(days=1)
-        start_date = datetime(previous_day.year, previous_day.month, previous_day.day, 0, 0, 0)
-        end_date = datetime(previous_day.year, previous_day.month, previous_day.day, 23, 59, 59)
-    elif days == "today":
-        # Сегодня
-        start_date = datetime(now.year, now.month, now.day, 0, 0, 0)
-        end_date = datetime(now.year, now.month, now.day, 23, 59, 59)
-    elif days == "yesterday":
-        # Вчера
-        yesterday = now - timedelta(days=1)
-        start_date = datetime(yesterday.year, yesterday.month, yesterday.day, 0, 0, 0)
-        end_date = datetime(yesterday.year, yesterday.month, yesterday.day, 23, 59, 59)
-    else:
-        # За последние N дней (по умолчанию 8)
-        days_int = int(days) if isinstance(days, str) else days
-        end_date = now
-        start_date = end_date - timedelta(days=days_int)
-    
-    start_date_str = start_date.strftime("%Y-%m-%d")
-    end_date_str = end_date.strftime("%Y-%m-%d")
-
-    if debug_out is None:
-        debug_out = {}
-    debug_out.setdefault("sources", {})
-
-    def _seconds_to_human(seconds: int) -> str:
-        if seconds <= 0:
-            return ""
-        # Jira-стиль "1h 30m"
-        m = int(round(seconds / 60.0))
-        h = m // 60
-        mm = m % 60
-        if h and mm:
-            return f"{h}h {mm}m"
-        if h:
-            return f"{h}h"
-        return f"{mm}m"
+    # Получаем поле TEAM (список полей кэшируется в Jira-клиенте)
+    team_field_id = jira.get_field_id(api_prefix, team_field_name)
 
     def _fetch_devsamurai_timelogs() -> list[dict]:
         """
@@ -316,17 +699,16 @@ def get_team_worklog(
             return []
 
         url = f"{base}/tbt/v1/timelogs/search"
-        members = [u.jira_account_id for u in users if u.jira_account_id]
+        members = account_ids
         if not members:
             return []
         payload = {"members": members, "startDate": start_date_str, "endDate": end_date_str}
         headers = {"accept": "application/json", "content-type": "application/json", "authorization": jwt}
 
-        with _make_http_session_for_integrations() as session:
-            r = session.post(url, headers=headers, json=payload, timeout=30)
+        r = _integration_session(url).post(url, headers=headers, json=payload, timeout=30)
         if r.status_code != 200:
             raise RuntimeError(f"DevSamurai timelogs/search failed: HTTP {r.status_code}: {r.text}")
-        data = r.json()
+        data = response_json(r)
         return data if isinstance(data, list) else []
 
     def _fetch_teamboard_timelogs() -> list[dict]:
@@ -344,7 +726,7 @@ def get_team_worklog(
         if not base:
             return []
 
-        user_ids = [u.jira_account_id for u in users if u.jira_account_id]
+        user_ids = account_ids
         if not user_ids:
             return []
 
@@ -357,244 +739,170 @@ def get_team_worklog(
         offset = 0
         out: list[dict] = []
         active_user_ids = list(dict.fromkeys(user_ids))
-        with _make_http_session_for_integrations() as session:
-            for _ in range(50):  # safety
-                if not active_user_ids:
-                    break
-                params = [
-                    ("from", start_date_str),
-                    ("to", end_date_str),
-                    ("limit", str(limit)),
-                    ("offset", str(offset)),
-                ]
-                for uid in active_user_ids:
-                    params.append(("userIds", uid))
-
-                r = session.get(url, headers=headers, params=params, timeout=30)
-                if r.status_code == 403:
-                    # Teamboard может валить весь ответ, если среди userIds есть невалидные аккаунты.
-                    # Пробуем исключить их и повторить запрос.
-                    invalid_ids: list[str] = []
-                    try:
-                        payload_403 = r.json() or {}
-                        errors = payload_403.get("errors") or []
-                        if isinstance(errors, list):
-                            for err in errors:
-                                if not isinstance(err, str):
-                                    continue
-                                m = re.search(r"Invalid user accounts:\s*(.+)$", err, flags=re.IGNORECASE)
-                                if not m:
-                                    continue
-                                invalid_ids.extend([x.strip() for x in m.group(1).split(",") if x.strip()])
-                    except Exception:
-                        pass
-                    if not invalid_ids:
-                        raise RuntimeError(f"Teamboard timelogs failed: HTTP {r.status_code}: {r.text}")
-
-                    active_user_ids = [uid for uid in active_user_ids if uid not in set(invalid_ids)]
-                    # Повторяем тот же offset уже без битых userIds
-                    continue
-                if r.status_code != 200:
+        known_invalid = _TEAMBOARD_INVALID_USERS.get(base)
+        if known_invalid is not None and time.time() - known_invalid[0] < TEAMBOARD_INVALID_USERS_TTL_S:
+            active_user_ids = [uid for uid in active_user_ids if uid not in known_invalid[1]]
+        session = _integration_session(url)
+        for _ in range(50):  # safety
+            if not active_user_ids:
+                break
+            params = [
+                ("from", start_date_str),
+                ("to", end_date_str),
+                ("limit", str(limit)),
+                ("offset", str(offset)),
+            ]
+            for uid in active_user_ids:
+                params.append(("userIds", uid))
+
+            r = session.get(url, headers=headers, params=params, timeout=30)
+            if r.status_code == 403:
+                # Teamboard может валить весь ответ, если среди userIds есть невалидные аккаунты.
+                # Пробуем исключить их и повторить запрос.
+                invalid_ids: set[str] = set()
+                try:
+                    payload_403 = r.json() or {}
+                    errors = payload_403.get("errors") or []
+                    if isinstance(errors, list):
+                        for err in errors:
+                            if not isinstance(err, str):
+                                continue
+                            m = _TEAMBOARD_INVALID_USERS_RE.search(err)
+                            if not m:
+                                continue
+                            invalid_ids.update(x.strip() for x in m.group(1).split(",") if x.strip())
+                except Exception:
+                    pass
+                if not invalid_ids:
                     raise RuntimeError(f"Teamboard timelogs failed: HTTP {r.status_code}: {r.text}")
 
-                payload = r.json() or {}
-                data = payload.get("data") or []
-                if isinstance(data, list):
-                    out.extend([x for x in data if isinstance(x, dict)])
+                remaining = [uid for uid in active_user_ids if uid not in invalid_ids]
+                if len(remaining) == len(active_user_ids):
+                    # Отвергнутых аккаунтов нет среди запрошенных — повтор дал бы тот же 403
+                    raise RuntimeError(f"Teamboard timelogs failed: HTTP {r.status_code}: {r.text}")
+                active_user_ids = remaining
+                cached_invalid = _TEAMBOARD_INVALID_USERS.get(base)
+                if cached_invalid is not None and time.time() - cached_invalid[0] < TEAMBOARD_INVALID_USERS_TTL_S:
+                    invalid_ids |= cached_invalid[1]
+                _TEAMBOARD_INVALID_USERS[base] = (time.time(), invalid_ids)
+                # Повторяем тот же offset уже без битых userIds
+                continue
+            if r.status_code != 200:
+                raise RuntimeError(f"Teamboard timelogs failed: HTTP {r.status_code}: {r.text}")
 
-                has_more = bool(payload.get("hasMore"))
-                if not has_more:
-                    break
-                offset = int(payload.get("offset") or offset) + int(payload.get("limit") or limit)
+            payload = response_json(r) or {}
+            data = payload.get("data") or []
+            if isinstance(data, list):
+                out.extend([x for x in data if isinstance(x, dict)])
 
-        return out
+            has_more = bool(payload.get("hasMore"))
+            if not has_more:
+                break
+            offset = int(payload.get("offset") or offset) + int(payload.get("limit") or limit)
 
-    def _fetch_issue_key_summary(issue_ref: int | str) -> tuple[str, str]:
-        """
-        Получить key+summary по issueId или issueKey.
-        """
-        try:
-            r = jira.request("GET", f"{api_prefix}/issue/{issue_ref}?fields=summary")
-            if r.status_code == 200:
-                j = r.json()
-                key = (j.get("key") or "").strip()
-                fallback = str(issue_ref)
-                return (
-                    key or fallback,
-                    (j.get("fields", {}) or {}).get("summary") or key or fallback,
-                )
-        except Exception:
-            pass
-        fallback = str(issue_ref)
-        return (fallback, fallback)
+        return out
 
-    def _get_worklogs_via_updated() -> List[dict]:
+    def _iter_worklogs_via_updated() -> Iterator[List[dict]]:
         """
         Быстрый и полный способ собрать worklog'и: /worklog/updated -> /worklog/list.
         Важно: updated возвращает изменения по времени обновления, поэтому берем since с запасом,
         а фильтруем уже по started (дате списания).
+        Тела отдаются чанками /worklog/list по мере загрузки: следующий чанк качается в фоне,
+        пока разбирается текущий, и в памяти не держим весь сырой список сразу.
         """
         # запас, чтобы не пропускать worklog'и, которые добавили/переотредактировали "задним числом"
         since_dt = start_date - timedelta(days=2)
         since_ms = int(since_dt.timestamp() * 1000)
 
-        worklog_ids: list[int] = []
-        seen_ids: set[int] = set()
-
-        # Пагинация делается через until/lastPage: пока lastPage=false, делаем since=until
-        safety = 0
-        while True:
-            safety += 1
-            if safety > 50:
-                break
-            r = jira.request("GET", f"{api_prefix}/worklog/updated?since={since_ms}")
-            if r.status_code != 200:
-                raise RuntimeError(f"worklog/updated failed: HTTP {r.status_code}: {r.text}")
-            payload = r.json() or {}
-            for v in (payload.get("values") or []):
-                wid = v.get("worklogId")
-                if isinstance(wid, int) and wid not in seen_ids:
-                    seen_ids.add(wid)
-                    worklog_ids.append(wid)
-            if payload.get("lastPage") is True:
-                break
-            until_ms = payload.get("until")
-            if not isinstance(until_ms, int) or until_ms <= since_ms:
-                break
-            since_ms = until_ms
-
-        if not worklog_ids:
-            return []
-
-        # Jira ограничивает payload — бьем на чанки
-        chunk_size = 1000
-        out: list[dict] = []
-        for i in range(0, len(worklog_ids), chunk_size):
-            chunk = worklog_ids[i : i + chunk_size]
-            r = jira.request("POST", f"{api_prefix}/worklog/list", json_body={"ids": chunk})
-            if r.status_code != 200:
-                raise RuntimeError(f"worklog/list failed: HTTP {r.status_code}: {r.text}")
-            data = r.json() or []
-            if isinstance(data, list):
-                out.extend([x for x in data if isinstance(x, dict)])
-        return out
+        worklog_ids = jira.worklog_updated_ids(api_prefix, since_ms)
+        chunks = [worklog_ids[i : i + WORKLOG_LIST_CHUNK] for i in range(0, len(worklog_ids), WORKLOG_LIST_CHUNK)]
+        if not chunks:
+            return
+        future = _BACKGROUND_EXECUTOR.submit(jira.worklog_list, api_prefix, chunks[0])
+        for next_chunk in chunks[1:]:
+            data = future.result()
+            future = _BACKGROUND_EXECUTOR.submit(jira.worklog_list, api_prefix, next_chunk)
+            yield data
+        yield future.result()
+
+    # accountId команды считаем здесь, в основном потоке: фоновые загрузки ниже не трогают users и сессию БД
+    account_ids = [u.jira_account_id for u in users if u.jira_account_id]
+
+    # DevSamurai и Teamboard не зависят от Jira: их HTTP идет в фоне, пока собираем worklog'и Jira.
+    # Разбор ответов и запись в агрегаты — ниже, в текущем потоке и в прежнем порядке источников;
+    # ошибка интеграции поднимается из result() в ее же try/except и не мешает остальным.
+    devsamurai_future = _BACKGROUND_EXECUTOR.submit(_fetch_devsamurai_timelogs)
+    teamboard_future = _BACKGROUND_EXECUTOR.submit(_fetch_teamboard_timelogs)
 
     # Собираем worklog по пользователям
-    user_worklog: Dict[int, Dict] = {}
-    for user in users:
-        user_worklog[user.id] = {
-            "user_id": user.id,
-            "user_name": user.display_name or user.jira_account_id,
-            "user_account_id": user.jira_account_id,
-            "total_seconds": 0,
-            "total_hours": 0.0,
-            "entries": [],
-        }
+    user_worklog: Dict[int, _UserWorklog] = {
+        user.id: _UserWorklog(user.id, user.display_name or user.jira_account_id, user.jira_account_id)
+        for user in users
+    }
+    worklog_by_account: Dict[str, _UserWorklog] = {u.jira_account_id: user_worklog[u.id] for u in users if u.jira_account_id}
 
     # Новый основной путь: берем все worklog'и через /worklog/updated (полнее и быстрее).
     # Если Jira не поддерживает — fallback на старый JQL/issue-worklog подход.
     try:
-        raw_worklogs = _get_worklogs_via_updated()
 
         # Сначала соберем метаданные по issueId/issueKey, чтобы не дергать Jira на каждую запись
         issue_ids: set[int] = set()
         issue_keys: set[str] = set()
 
-        normalized: list[dict] = []
-        for wl in raw_worklogs:
-            author = wl.get("author") or {}
-            account_id = author.get("accountId")
-            if not account_id or account_id not in user_by_account_id:
+        # Запись сразу собираем в _WorklogEntry (key/summary дописываются после пакетного запроса
+        # метаданных), а в агрегаты кладем только после успешного прохода: при падении и откате
+        # на legacy-путь суммы не задваиваются
+        pending: list[tuple[_UserWorklog, _WorklogEntry, int | None, str]] = []
+        for wl in (wl for chunk in _iter_worklogs_via_updated() for wl in chunk):
+            # Самый дешевый фильтр первым: автор не из команды — дальше запись не разбираем
+            user_data = worklog_by_account.get((wl.get("author") or {}).get("accountId"))
+            if user_data is None:
                 continue
 
             started = wl.get("started")
             if not started:
                 continue
 
-            # started может быть "2025-04-01T11:30:57.000+0300" или "...Z"
-            try:
-                date_str = started
-                if date_str.endswith("Z"):
-                    date_str = date_str.replace("Z", "+00:00")
-                else:
-                    import re
-                    date_str = re.sub(r"\.\d{3}", "", date_str)
-                    date_str = re.sub(r"([+-])(\d{2})(\d{2})$", r"\1\2:\3", date_str)
-                wl_dt = datetime.fromisoformat(date_str)
-            except Exception:
-                continue
-
-            # Фильтруем по диапазону именно started (дата списания), а не updatedTime
-            if wl_dt.date() < start_date.date() or wl_dt.date() > end_date.date():
+            # started приходит как "2025-04-01T11:30:57.000+0300" или "...Z": первые 10 символов —
+            # дата списания в поясе автора. Фильтруем по диапазону именно started (а не updatedTime)
+            # сравнением ISO-строк, без regex и datetime.fromisoformat на каждую запись.
+            worklog_date = started[:10]
+            if len(worklog_date) != 10 or worklog_date < start_date_str or worklog_date > end_date_str:
                 continue
 
+            # Один ответ поиска заполняет обе мапы (по id и по key), поэтому ключ запрашиваем,
+            # только если id нет — иначе одна и та же задача попала бы в JQL дважды
             issue_id, issue_key = _extract_issue_ref_from_worklog(wl)
             if issue_id is not None:
                 issue_ids.add(issue_id)
-            if issue_key:
+            elif issue_key:
                 issue_keys.add(issue_key)
 
-            normalized.append({
-                "account_id": account_id,
-                "started": started,
-                "worklog_date": wl_dt.date().strftime("%Y-%m-%d"),
-                "time_spent_seconds": int(wl.get("timeSpentSeconds") or 0),
-                "time_spent": wl.get("timeSpent") or "",
-                "comment": _comment_to_text(wl.get("comment")),
-                "issue_id": issue_id,
-                "issue_key": issue_key,
-            })
-
-        issue_meta: Dict[int, tuple[str, str]] = {}
-        issue_meta_by_key: Dict[str, tuple[str, str]] = {}
-        if issue_ids:
-            with ThreadPoolExecutor(max_workers=10) as ex:
-                future_to_id = {ex.submit(_fetch_issue_key_summary, iid): iid for iid in issue_ids}
-                for fut in as_completed(future_to_id):
-                    iid = future_to_id[fut]
-                    try:
-                        issue_meta[iid] = fut.result()
-                    except Exception:
-                        issue_meta[iid] = (str(iid), str(iid))
-        if issue_keys:
-            with ThreadPoolExecutor(max_workers=10) as ex:
-                future_to_key = {ex.submit(_fetch_issue_key_summary, ik): ik for ik in issue_keys}
-                for fut in as_completed(future_to_key):
-                    ik = future_to_key[fut]
-                    try:
-                        issue_meta_by_key[ik] = fut.result()
-                    except Exception:
-                        issue_meta_by_key[ik] = (ik, ik)
-
-        for item in normalized:
-            user = user_by_account_id[item["account_id"]]
-            user_data = user_worklog[user.id]
-            user_data["total_seconds"] += item["time_spent_seconds"]
-            user_data["total_hours"] = user_data["total_seconds"] / 3600.0
-
-            issue_key = ""
-            issue_summary = ""
-            iid = item.get("issue_id")
-            if isinstance(iid, int) and iid in issue_meta:
-                issue_key, issue_summary = issue_meta[iid]
-            elif item.get("issue_key") in issue_meta_by_key:
-                issue_key, issue_summary = issue_meta_by_key[item["issue_key"]]
-            elif item.get("issue_key"):
-                issue_key = str(item["issue_key"])
-                issue_summary = str(item["issue_key"])
-            elif isinstance(iid, int):
-                issue_key = str(iid)
-                issue_summary = str(iid)
-
-            user_data["entries"].append({
-                "issue_key": issue_key,
-                "issue_summary": issue_summary,
-                "started": item["started"],
-                "worklog_date": item["worklog_date"],
-                "time_spent_seconds": item["time_spent_seconds"],
-                "time_spent": item["time_spent"],
-                "comment": item["comment"],
-            })
+            entry = _WorklogEntry(
+                issue_key="",
+                issue_summary="",
+                started=started,
+                worklog_date=worklog_date,
+                time_spent_seconds=int(wl.get("timeSpentSeconds") or 0),
+                time_spent=wl.get("timeSpent") or "",
+                comment=_comment_to_text(wl.get("comment")),
+            )
+            pending.append((user_data, entry, issue_id, issue_key))
+
+        # key+summary всех задач одним проходом: JQL `issue in (...)` понимает и id, и ключи
+        issue_meta, issue_meta_by_key = _fetch_issue_meta_batch(jira, api_prefix, [*issue_ids, *issue_keys])
+
+        for user_data, entry, iid, ikey in pending:
+            if iid is not None and iid in issue_meta:
+                entry.issue_key, entry.issue_summary = issue_meta[iid]
+            elif ikey in issue_meta_by_key:
+                entry.issue_key, entry.issue_summary = issue_meta_by_key[ikey]
+            elif ikey:
+                entry.issue_key = entry.issue_summary = ikey
+            elif iid is not None:
+                entry.issue_key = entry.issue_summary = str(iid)
+            user_data.total_seconds += entry.time_spent_seconds
+            user_data.entries.append(entry)
     except Exception as e:
         # Fallback (старый подход) — оставляем на всякий случай для несовместимых инстансов.
         # Важно: сюда попадаем только если новый метод совсем не работает.
@@ -602,36 +910,44 @@ def get_team_worklog(
 
         # Для каждого пользователя ищем задачи, где он списывал время в нужный период
         # Используем JQL с worklogAuthor и worklogDate
-        account_ids = [u.jira_account_id for u in users if u.jira_account_id]
-
-        # Ограничиваем количество пользователей для производительности
-        max_users_to_check = 20  # Уменьшено для ускорения
-        account_ids_to_check = account_ids[:max_users_to_check]
+        account_ids_to_check = account_ids
 
         all_issues_set = set()  # Множество для уникальных задач
+        # summary уже приходит в поиске (fields=["key", "summary"]) — не перезапрашиваем его по каждой задаче
+        issue_summary_by_key: Dict[str, str] = {}
         use_worklog_author = False
 
-        # Пробуем использовать worklogAuthor для каждого пользователя
-        for account_id in account_ids_to_check:
-            jql = f'worklogAuthor = "{account_id}" AND worklogDate >= "{start_date_str}" AND worklogDate <= "{end_date_str}"'
+        # Пробуем использовать worklogAuthor: один постраничный поиск `worklogAuthor in (...)`
+        # на пачку пользователей вместо отдельного поиска на каждого
+        for i in range(0, len(account_ids_to_check), WORKLOG_AUTHOR_JQL_CHUNK):
+            authors = ", ".join(f'"{a}"' for a in account_ids_to_check[i : i + WORKLOG_AUTHOR_JQL_CHUNK])
+            jql = f'worklogAuthor in ({authors}) AND worklogDate >= "{start_date_str}" AND worklogDate <= "{end_date_str}"'
 
             next_token = ""
             page_size = 200
 
             try:
-                data = jira.search_jql_page(jql=jql, fields=["key", "summary"], max_results=page_size, next_page_token=next_token)
-                issues = data.get("issues", []) or data.get("values", [])
-                if issues:
-                    use_worklog_author = True
-                    for issue in issues:
-                        issue_key = issue.get("key")
-                        if issue_key:
-                            all_issues_set.add(issue_key)
+                for _ in range(WORKLOG_AUTHOR_MAX_PAGES):
+                    data = jira.search_jql_page(jql=jql, fields=["key", "summary"], max_results=page_size, next_page_token=next_token)
+                    issues = data.get("issues", []) or data.get("values", [])
+                    if issues:
+                        use_worklog_author = True
+                        for issue in issues:
+                            issue_key = issue.get("key")
+                            if issue_key:
+                                all_issues_set.add(issue_key)
+                                issue_summary_by_key[issue_key] = (issue.get("fields") or {}).get("summary") or issue_key
+                    next_token = (data.get("nextPageToken") or "").strip()
+                    if not next_token:
+                        break
             except Exception:
                 pass
 
         if (not use_worklog_author or not all_issues_set) and not is_custom and team is not None:
-            jql = f'"{team_field_id}" = "{team.jira_team_id}"'
+            jql = (
+                f'"{team_field_id}" = "{team.jira_team_id}"'
+                f' AND worklogDate >= "{start_date_str}" AND worklogDate <= "{end_date_str}"'
+            )
             next_token = ""
             page_size = 200
             while True:
@@ -643,95 +959,75 @@ def get_team_worklog(
                     issue_key = issue.get("key")
                     if issue_key:
                         all_issues_set.add(issue_key)
+                        issue_summary_by_key[issue_key] = (issue.get("fields") or {}).get("summary") or issue_key
                 next_token = (data.get("nextPageToken") or "").strip()
                 if not next_token:
                     break
 
-        max_issues_to_check = 300
-        issues_to_check = list(all_issues_set)[:max_issues_to_check]
+        # Поиск уже ограничен окном worklogDate, поэтому обходим все найденные задачи;
+        # WORKLOG_MAX_ISSUES — только защита от патологически больших выборок
+        issues_to_check = list(all_issues_set)
+        if len(issues_to_check) > WORKLOG_MAX_ISSUES:
+            print(f"Warning: {len(issues_to_check)} issues with worklogs, checking first {WORKLOG_MAX_ISSUES}")
+            issues_to_check = issues_to_check[:WORKLOG_MAX_ISSUES]
 
-        def fetch_worklog_for_issue(issue_key: str) -> tuple[str, dict, str]:
+        # Окно с запасом в сутки с каждой стороны: started в часовом поясе автора, точный фильтр — ниже по строке
+        started_after_ms = int((start_date - timedelta(days=1)).timestamp() * 1000)
+        started_before_ms = int((end_date + timedelta(days=1)).timestamp() * 1000)
+
+        def fetch_worklog_for_issue(issue_key: str) -> list[dict]:
             try:
-                worklog_data = jira.get_worklog(api_prefix, issue_key)
-                worklogs = worklog_data.get("worklogs", [])
-                issue_summary = issue_key
-                try:
-                    issue_data = jira.request("GET", f"{api_prefix}/issue/{issue_key}?fields=summary")
-                    if issue_data.status_code == 200:
-                        issue_json = issue_data.json()
-                        issue_summary = issue_json.get("fields", {}).get("summary", issue_key)
-                except Exception:
-                    pass
-                return (issue_key, {"worklogs": worklogs}, issue_summary)
+                worklog_data = jira.get_worklog(
+                    api_prefix, issue_key, started_after_ms=started_after_ms, started_before_ms=started_before_ms
+                )
+                return worklog_data.get("worklogs", [])
             except Exception:
-                return (issue_key, {"worklogs": []}, issue_key)
-
-        issue_worklogs: Dict[str, tuple] = {}
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_issue = {executor.submit(fetch_worklog_for_issue, issue_key): issue_key for issue_key in issues_to_check}
-            for future in as_completed(future_to_issue):
-                try:
-                    result = future.result()
-                    issue_worklogs[result[0]] = (result[1], result[2])
-                except Exception:
-                    pass
-
-        for issue_key in issues_to_check:
-            if issue_key not in issue_worklogs:
-                continue
-            worklog_data, issue_summary = issue_worklogs[issue_key]
-            worklogs = worklog_data.get("worklogs", [])
-
+                return []
+
+        # Сеть ждем в пуле потоков, а разбираем ответы в текущем потоке по мере готовности
+        # (executor.map сохраняет порядок задач), без промежуточного словаря всех ответов.
+        # Пул общий на процесс (_JIRA_EXECUTOR): одновременные вызовы делят одни потоки, а не
+        # поднимают каждый свой пул
+        for issue_key, worklogs in zip(issues_to_check, _JIRA_EXECUTOR.map(fetch_worklog_for_issue, issues_to_check)):
+            issue_summary = issue_summary_by_key.get(issue_key, issue_key)
             for wl in worklogs:
-                author = wl.get("author", {})
-                account_id = author.get("accountId")
-                if not account_id or account_id not in user_by_account_id:
+                user_data = worklog_by_account.get((wl.get("author") or {}).get("accountId"))
+                if user_data is None:
                     continue
 
-                user = user_by_account_id[account_id]
                 started = wl.get("started")
-                time_spent_seconds = wl.get("timeSpentSeconds", 0)
-                comment = _comment_to_text(wl.get("comment"))
 
+                # JQL отбирает задачи, а не worklog'и: в задаче есть списания и за другие дни,
+                # поэтому фильтр по дате остается. started приходит как "YYYY-MM-DDThh:mm:ss.SSS±hhmm" —
+                # первые 10 символов и есть дата списания, ISO-даты сравниваются как строки.
                 worklog_date = None
                 if started:
-                    try:
-                        date_str = started
-                        if date_str.endswith("Z"):
-                            date_str = date_str.replace("Z", "+00:00")
-                        else:
-                            import re
-                            date_str = re.sub(r"\.\d{3}", "", date_str)
-                            date_str = re.sub(r"([+-])(\d{2})(\d{2})$", r"\1\2:\3", date_str)
-                        wl_date = datetime.fromisoformat(date_str)
-                        worklog_date = wl_date.date()
-                        if worklog_date < start_date.date() or worklog_date > end_date.date():
-                            continue
-                    except Exception:
+                    worklog_date = started[:10]
+                    if len(worklog_date) != 10 or worklog_date < start_date_str or worklog_date > end_date_str:
                         continue
 
-                user_data = user_worklog[user.id]
-                user_data["total_seconds"] += time_spent_seconds
-                user_data["total_hours"] = user_data["total_seconds"] / 3600.0
-
-                user_data["entries"].append({
-                    "issue_key": issue_key,
-                    "issue_summary": issue_summary,
-                    "started": started,
-                    "worklog_date": worklog_date.strftime("%Y-%m-%d") if worklog_date else None,
-                    "time_spent_seconds": time_spent_seconds,
-                    "time_spent": wl.get("timeSpent", ""),
-                    "comment": comment,
-                })
+                # Запись собираем только для прошедших фильтры worklog'ов
+                time_spent_seconds = wl.get("timeSpentSeconds", 0)
+                user_data.total_seconds += time_spent_seconds
+                user_data.entries.append(_WorklogEntry(
+                    issue_key=issue_key,
+                    issue_summary=issue_summary,
+                    started=started,
+                    worklog_date=worklog_date,
+                    time_spent_seconds=time_spent_seconds,
+                    time_spent=wl.get("timeSpent", ""),
+                    comment=_comment_to_text(wl.get("comment")),
+                ))
 
     # Дополнительно: DevSamurai (TimePlanner/Timesheet Builder) timelogs типа Event/custom_task
     # Они не являются Jira worklog, поэтому добавляем отдельным источником.
     try:
-        dev_logs = _fetch_devsamurai_timelogs()
+        dev_logs = devsamurai_future.result()
         debug_out["sources"]["devsamurai"] = {"enabled": True, "count": len(dev_logs)}
+        user_by_account = worklog_by_account.get
         for tl in dev_logs:
-            account_id = tl.get("assignee")
-            if not account_id or account_id not in user_by_account_id:
+            user_data = user_by_account(tl.get("assignee"))
+            if user_data is None:
                 continue
             date_s = tl.get("date")  # YYYY-MM-DD
             if not date_s:
@@ -754,19 +1050,16 @@ def get_team_worklog(
                 # чтобы было понятно, что это не Jira worklog
                 comment = f"[TimePlanner:{log_type}] {summary}" if summary else f"[TimePlanner:{log_type}]"
 
-            user = user_by_account_id[account_id]
-            user_data = user_worklog[user.id]
-            user_data["total_seconds"] += seconds
-            user_data["total_hours"] = user_data["total_seconds"] / 3600.0
-            user_data["entries"].append({
-                "issue_key": "",
-                "issue_summary": "Event" if log_type else "TimePlanner",
-                "started": tl.get("loggedAt"),
-                "worklog_date": date_s,
-                "time_spent_seconds": seconds,
-                "time_spent": _seconds_to_human(seconds),
-                "comment": comment,
-            })
+            user_data.total_seconds += seconds
+            user_data.entries.append(_WorklogEntry(
+                issue_key="",
+                issue_summary="Event" if log_type else "TimePlanner",
+                started=tl.get("loggedAt"),
+                worklog_date=date_s,
+                time_spent_seconds=seconds,
+                time_spent=_seconds_to_human(seconds),
+                comment=comment,
+            ))
     except Exception as e:
         debug_out["sources"]["devsamurai"] = {"enabled": bool((settings.devsamurai_timesheet_jwt or "").strip()), "error": str(e)}
         print(f"DevSamurai timelogs fetch failed: {e}")
@@ -774,21 +1067,22 @@ def get_team_worklog(
     # Альтернатива/дополнение: Teamboard Public API timelogs
     # (если в Teamboard есть Event-типы, они приходят здесь отдельным type, issueId может быть null)
     try:
-        tb_logs = _fetch_teamboard_timelogs()
+        tb_logs = teamboard_future.result()
         debug_out["sources"]["teamboard"] = {
             "enabled": bool((settings.teamboard_bearer_jwt or "").strip()),
             "count": len(tb_logs),
         }
 
-        issue_ids: set[int] = set()
-        normalized_tb: list[dict] = []
-        included_events = 0
+        # Записи собираем сразу в _WorklogEntry по корзинам пользователей, а в агрегаты кладем
+        # после всего прохода (одним extend и одной суммой на пользователя), чтобы ошибка
+        # посреди ответа не оставила частично учтенные события
+        pending_tb: defaultdict[str, List[_WorklogEntry]] = defaultdict(list)
         skipped_issue_logs = 0
         skipped_issue_logs_non_numeric = 0
 
         for tl in tb_logs:
             account_id = tl.get("assignee")
-            if not account_id or account_id not in user_by_account_id:
+            if account_id not in worklog_by_account:
                 continue
 
             date_s = tl.get("date")
@@ -799,8 +1093,7 @@ def get_team_worklog(
             # Jira-логи мы уже считаем через Jira worklog (чтобы не было дублей),
             # поэтому исключаем только записи с РЕАЛЬНЫМ issueId.
             raw_issue_id = tl.get("issueId")
-            issue_id = _coerce_issue_id(raw_issue_id)
-            if issue_id is not None:
+            if _coerce_issue_id(raw_issue_id) is not None:
                 skipped_issue_logs += 1
                 continue
 
@@ -813,72 +1106,46 @@ def get_team_worklog(
                 continue
 
             # Иногда в event прилетают странные "issueId" (пустая строка/"null"/нечисловые),
-            # не считаем их Jira-логами и не отбрасываем запись.
-            if raw_issue_id not in (None, "") and issue_id is None:
+            # не считаем их Jira-логами и не отбрасываем запись. Числовые id отсеяны выше,
+            # так что любое непустое значение здесь — нечисловое.
+            if raw_issue_id:
                 skipped_issue_logs_non_numeric += 1
 
-            normalized_tb.append({
-                "account_id": account_id,
-                "date": date_s,
-                "seconds": seconds,
-                "type": (tl.get("type") or "").strip(),
-                "notes": (tl.get("notes") or "").strip(),
-                "summary": (tl.get("summary") or "").strip() if isinstance(tl.get("summary"), str) else "",
-                "issue_id": issue_id,
-                "started": ((tl.get("info") or {}) if isinstance(tl.get("info"), dict) else {}).get("started"),
-            })
-            included_events += 1
+            # До сюда доходят только события без issueId, поэтому ключа задачи у записи нет
+            log_type = (tl.get("type") or "").strip()
+            summary = tl.get("summary")
+            summary = summary.strip() if isinstance(summary, str) else ""
+            comment = (tl.get("notes") or "").strip() or summary
+            if log_type:
+                # comment уже без пробелов по краям — как у DevSamurai, без повторного strip
+                comment = f"[Teamboard:{log_type}] {comment}" if comment else f"[Teamboard:{log_type}]"
+            info = tl.get("info")
+
+            pending_tb[account_id].append(_WorklogEntry(
+                issue_key="",
+                issue_summary=summary or log_type or "Event",
+                started=info.get("started") if isinstance(info, dict) else None,
+                worklog_date=date_s,
+                time_spent_seconds=seconds,
+                time_spent=_seconds_to_human(seconds),
+                comment=comment,
+            ))
 
         # Обновим debug-статистику уже после фильтра (чтобы было видно, что мы не дублируем Jira issue logs)
         debug_out["sources"]["teamboard"].update({
-            "included_events": included_events,
+            "included_events": sum(map(len, pending_tb.values())),
             "skipped_issue_logs": skipped_issue_logs,
             "skipped_issue_logs_non_numeric": skipped_issue_logs_non_numeric,
         })
 
-        issue_meta: Dict[int, tuple[str, str]] = {}
-        if issue_ids:
-            with ThreadPoolExecutor(max_workers=10) as ex:
-                future_to_id = {ex.submit(_fetch_issue_key_summary, iid): iid for iid in issue_ids}
-                for fut in as_completed(future_to_id):
-                    iid = future_to_id[fut]
-                    try:
-                        issue_meta[iid] = fut.result()
-                    except Exception:
-                        issue_meta[iid] = (str(iid), str(iid))
-
-        for item in normalized_tb:
-            user = user_by_account_id[item["account_id"]]
-            user_data = user_worklog[user.id]
-            user_data["total_seconds"] += item["seconds"]
-            user_data["total_hours"] = user_data["total_seconds"] / 3600.0
-
-            issue_key = ""
-            issue_summary = item["summary"] or (item["type"] or "Event")
-            if item.get("issue_id") is not None:
-                ik, isum = issue_meta.get(item["issue_id"], ("", ""))
-                issue_key = ik
-                issue_summary = isum or issue_summary
-
-            comment = item["notes"] or item["summary"]
-            if item["type"]:
-                comment = f"[Teamboard:{item['type']}] {comment}".strip()
-
-            user_data["entries"].append({
-                "issue_key": issue_key,
-                "issue_summary": issue_summary,
-                "started": item.get("started"),
-                "worklog_date": item["date"],
-                "time_spent_seconds": item["seconds"],
-                "time_spent": _seconds_to_human(item["seconds"]),
-                "comment": comment,
-            })
+        for account_id, entries in pending_tb.items():
+            user_data = worklog_by_account[account_id]
+            user_data.total_seconds += sum(e.time_spent_seconds for e in entries)
+            user_data.entries.extend(entries)
     except Exception as e:
         debug_out["sources"]["teamboard"] = {"enabled": bool((settings.teamboard_bearer_jwt or "").strip()), "error": str(e)}
         print(f"Teamboard timelogs fetch failed: {e}")
 
-    # Сортируем по убыванию времени
-    result = sorted(user_worklog.values(), key=lambda x: x["total_seconds"], reverse=True)
-    
-    return result
+    # Сортируем по убыванию времени; в dict (и total_hours) превращает get_team_worklog на выдаче
+    return sorted(user_worklog.values(), key=attrgetter("total_seconds"), reverse=True)
 
@@ -0,0 +1,33 @@
+import unittest
+
+from app import jira_client
+from app.jira_client import Jira
+from app.sync_jira import sync_from_jira_for_credential
+
+
+class _Response:
+    def __init__(self, status_code: int, text: str = "") -> None:
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+
+
+class _UnauthorizedJira(Jira):
+    def request(self, method, path, params=None, json_body=None):
+        return _Response(401, "Unauthorized")
+
+
+class SyncFieldErrorsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        jira_client._FIELDS_CACHE.clear()
+        jira_client._FIELD_ID_CACHE.clear()
+
+    def test_field_http_error_propagates(self) -> None:
+        jira = _UnauthorizedJira("https://jira.example.test", {})
+        with self.assertRaises(RuntimeError) as ctx:
+            sync_from_jira_for_credential(None, credential_id=1, jira=jira, api_prefix="/rest/api/3")
+        self.assertIn("HTTP 401", str(ctx.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,19 +1,94 @@
 import argparse
 import base64
 import csv
+import hashlib
 import json
 import os
 import sys
 import time
-from typing import Any, Dict, List, Optional, Tuple
+from contextlib import nullcontext
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
+from typing import Any, Callable, DefaultDict, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+# Jira сама урежет maxResults до своего лимита (обычно 100 для /search с полями, до 1000 на Server)
+SEARCH_PAGE_SIZE = 1000
+SEARCH_PAGE_WORKERS = 8
+# REST-префикс и список полей (/field, сотни КБ) между запусками почти не меняются —
+# держим их на диске в ~/.cache/jira_teams/<host>/<хэш авторизации>/ (см. --refresh-cache)
+METADATA_CACHE_TTL_S = 24 * 3600
 
 
 def eprint(*args: object) -> None:
     print(*args, file=sys.stderr)
 
 
+def response_json(r: requests.Response) -> Any:
+    """
+    JSON тела ответа. С orjson (если установлен) парсим сырые байты — страницы поиска
+    в сотни КБ разбираются в разы быстрее r.json(); Jira всегда отдает UTF-8.
+    """
+    if orjson is not None:
+        return orjson.loads(r.content)
+    return r.json()
+
+
+def dumps_json(obj: Any) -> bytes:
+    """
+    JSON в байты: отступ 2, UTF-8 без экранирования не-ASCII; через orjson, если он есть.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def write_json(path: str, obj: Any) -> None:
+    with open(path, "wb") as f:
+        f.write(dumps_json(obj))
+
+
+class RawPageDump:
+    """
+    Потоковая запись сырых страниц поиска в файл вида {"pages": [...]} (--dump-raw).
+    Каждая страница уходит на диск сразу и в памяти не копится; файл выглядит так же,
+    как write_json(path, {"pages": pages}).
+    """
+
+    def __init__(self, path: str) -> None:
+        self._f = open(path, "wb")
+        self._f.write(b'{\n  "pages": [')
+        self.count = 0
+
+    def __call__(self, page: dict) -> None:
+        # Переводов строк внутри JSON-строк нет (они экранированы) — сдвигаем страницу целиком
+        self._f.write((b",\n    " if self.count else b"\n    ") + dumps_json(page).replace(b"\n", b"\n    "))
+        self.count += 1
+
+    def close(self) -> None:
+        # Закрываем и при ошибке посреди поиска: уже записанные страницы остаются валидным JSON
+        if self._f.closed:
+            return
+        self._f.write(b"\n  ]\n}" if self.count else b"]\n}")
+        self._f.close()
+
+    def __enter__(self) -> "RawPageDump":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
 def configure_utf8_console() -> None:
     try:
         if hasattr(sys.stdout, "reconfigure"):
@@ -46,12 +121,58 @@ def load_env_file(path: str) -> None:
                 os.environ.setdefault(k, v)
 
 
+def metadata_cache_dir(base_url: str, headers: Dict[str, str]) -> str:
+    """
+    Каталог дискового кэша метаданных Jira. Ключ — хост и хэш заголовка авторизации,
+    чтобы разные пользователи одной Jira не видели закэшированные поля друг друга.
+    """
+    host = urlsplit(base_url).netloc or "jira"
+    subject = hashlib.sha256((headers.get("Authorization") or "").encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.expanduser("~"), ".cache", "jira_teams", host, subject)
+
+
+def read_cache(path: str) -> Any:
+    """JSON из файла кэша, если он моложе METADATA_CACHE_TTL_S; иначе None."""
+    try:
+        if time.time() - os.path.getmtime(path) >= METADATA_CACHE_TTL_S:
+            return None
+        with open(path, "rb") as f:
+            return orjson.loads(f.read()) if orjson is not None else json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(path: str, obj: Any) -> None:
+    """Кэш — необязательная оптимизация: ошибки записи не мешают работе скрипта."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_json(path, obj)
+    except OSError as e:
+        eprint(f"Warning: не удалось записать кэш {path}: {e}")
+
+
 class Jira:
-    def __init__(self, base_url: str, headers: Dict[str, str], timeout_s: int = 30) -> None:
+    def __init__(
+        self, base_url: str, headers: Dict[str, str], timeout_s: int = 30, *, cache_dir: str = "", refresh_cache: bool = False
+    ) -> None:
         self.base_url = base_url.rstrip("/")
+        # Пустой cache_dir — без дискового кэша; refresh_cache — не читать кэш, но перезаписать его
+        self.cache_dir = cache_dir
+        self.refresh_cache = refresh_cache
         self.session = requests.Session()
         self.session.headers.update(headers)
+        # Keep-alive пул не меньше числа потоков постраничной загрузки. Повторы — только на 502/503/504
+        # для идемпотентных методов; 429 обрабатывается в request() по Retry-After.
+        # gzip/deflate requests запрашивает и распаковывает сам (Accept-Encoding по умолчанию).
+        adapter = HTTPAdapter(
+            pool_connections=SEARCH_PAGE_WORKERS,
+            pool_maxsize=SEARCH_PAGE_WORKERS,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504), raise_on_status=False),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.timeout_s = timeout_s
+        self._field_index: Dict[str, Dict[str, str]] = {}
 
     def request(
         self,
@@ -79,17 +200,55 @@ class Jira:
         if forced:
             return forced.rstrip("/")
 
+        cache_path = self._cache_path("api_prefix.json")
+        cached = self._read_cache(cache_path)
+        if isinstance(cached, str) and cached:
+            return cached
         for prefix in ("/rest/api/3", "/rest/api/2"):
             r = self.request("GET", f"{prefix}/serverInfo")
             if r.status_code in (200, 401, 403):
+                if cache_path:
+                    write_cache(cache_path, prefix)
                 return prefix
         raise RuntimeError("Не удалось определить Jira REST API префикс. Укажите --api-prefix.")
 
     def get_fields(self, api_prefix: str) -> List[dict]:
+        cache_path = self._cache_path(f"fields{api_prefix.replace('/', '_')}.json")
+        cached = self._read_cache(cache_path)
+        if isinstance(cached, list):
+            return cached
         r = self.request("GET", f"{api_prefix}/field")
         if r.status_code != 200:
             raise RuntimeError(f"Не удалось получить поля: HTTP {r.status_code}: {r.text}")
-        return r.json()
+        fields = response_json(r)
+        if cache_path:
+            write_cache(cache_path, fields)
+        return fields
+
+    def _cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name) if self.cache_dir else ""
+
+    def _read_cache(self, path: str) -> Any:
+        if not path or self.refresh_cache:
+            return None
+        return read_cache(path)
+
+    def get_field_id(self, api_prefix: str, field_name: str) -> str:
+        """
+        find_field_id с индексом полей, который строится один раз на api_prefix.
+        Если поля нет в списке из дискового кэша — перечитываем /field (поле могли создать позже).
+        """
+        index = self._field_index.get(api_prefix)
+        if index is None:
+            index = self._field_index[api_prefix] = build_field_index(self.get_fields(api_prefix))
+        try:
+            return find_field_id([], field_name, index)
+        except RuntimeError:
+            if not self.cache_dir or self.refresh_cache:
+                raise
+        self.refresh_cache = True
+        index = self._field_index[api_prefix] = build_field_index(self.get_fields(api_prefix))
+        return find_field_id([], field_name, index)
 
     def search_jql_page(self, jql: str, fields: List[str], max_results: int, next_page_token: str = "") -> dict:
         """
@@ -102,7 +261,7 @@ class Jira:
         r = self.request("POST", "/rest/api/3/search/jql", json_body=body)
         if r.status_code != 200:
             raise RuntimeError(f"Search (jql) failed: HTTP {r.status_code}: {r.text}")
-        return r.json()
+        return response_json(r)
 
 
 def build_headers_from_env() -> Tuple[str, Dict[str, str]]:
@@ -130,14 +289,29 @@ def build_headers_from_env() -> Tuple[str, Dict[str, str]]:
     raise RuntimeError("Нужна авторизация: JIRA_EMAIL+JIRA_API_TOKEN (Cloud) или JIRA_TOKEN (Bearer).")
 
 
-def find_field_id(fields: List[dict], field_name: str) -> str:
-    target = field_name.strip().lower()
-    for f in fields:
-        if (f.get("name") or "").strip().lower() == target:
-            return f["id"]
+def build_field_index(fields: List[dict]) -> Dict[str, str]:
+    """
+    {имя поля в нижнем регистре: id}. При одинаковых именах побеждает первое — как в линейном поиске.
+    """
+    index: Dict[str, str] = {}
     for f in fields:
-        if target in ((f.get("name") or "").strip().lower()):
-            return f["id"]
+        index.setdefault((f.get("name") or "").strip().lower(), f["id"])
+    return index
+
+
+def find_field_id(fields: List[dict], field_name: str, index: Optional[Dict[str, str]] = None) -> str:
+    """
+    Точное совпадение имени — через индекс за O(1), иначе один проход по подстроке.
+    """
+    target = field_name.strip().lower()
+    if index is None:
+        index = build_field_index(fields)
+    field_id = index.get(target)
+    if field_id is not None:
+        return field_id
+    for name, field_id in index.items():
+        if target in name:
+            return field_id
     raise RuntimeError(f"Поле '{field_name}' не найдено в /field. Проверьте имя.")
 
 
@@ -176,13 +350,16 @@ def normalize_user(u: Any) -> Optional[dict]:
     """
     if not isinstance(u, dict):
         return None
-    display = u.get("displayName") or u.get("name") or u.get("accountId") or ""
-    account_id = u.get("accountId")
-    email = u.get("emailAddress")
-    key = account_id or u.get("key") or u.get("name") or display
+    key = user_key(u)
     if not key:
         return None
-    return {"key": key, "displayName": display, "accountId": account_id, "email": email}
+    display = u.get("displayName") or u.get("name") or u.get("accountId") or ""
+    return {"key": key, "displayName": display, "accountId": u.get("accountId"), "email": u.get("emailAddress")}
+
+
+def user_key(u: dict) -> str:
+    """Ключ пользователя Jira: accountId (Cloud), иначе key/name (Server), иначе displayName."""
+    return u.get("accountId") or u.get("key") or u.get("name") or u.get("displayName") or ""
 
 
 def iterate_issues(
@@ -192,70 +369,89 @@ def iterate_issues(
     jql: str,
     fields: List[str],
     max_issues: int,
-    raw_pages_out: Optional[List[dict]] = None,
+    on_raw_page: Optional[Callable[[dict], None]] = None,
 ) -> List[dict]:
     """
     Возвращает список issues (с полями), используя:
     - legacy GET {api_prefix}/search (если доступен)
     - либо Jira Cloud POST /rest/api/3/search/jql (если /search удалён и отдаёт 410)
     """
-    page_size = 200
-    fetched = 0
+    page_size = SEARCH_PAGE_SIZE
     out: List[dict] = []
 
+    def fetch_page(start_at: int) -> Tuple[dict, dict]:
+        params = {"jql": jql, "fields": ",".join(fields), "startAt": start_at, "maxResults": page_size}
+        r = jira.request("GET", f"{api_prefix}/search", params=params)
+        if r.status_code != 200:
+            raise RuntimeError(f"Search failed: HTTP {r.status_code}: {r.text}")
+        return params, response_json(r)
+
     # Legacy /search
     start_at = 0
     params = {"jql": jql, "fields": ",".join(fields), "startAt": start_at, "maxResults": page_size}
     r = jira.request("GET", f"{api_prefix}/search", params=params)
 
     if r.status_code == 200:
-        data = r.json()
-        if raw_pages_out is not None:
-            raw_pages_out.append(
-                {
-                    "method": "GET",
-                    "path": f"{api_prefix}/search",
-                    "params": params,
-                    "status": r.status_code,
-                    "response": data,
-                }
-            )
-        while True:
-            issues = data.get("issues", [])
-            if not issues:
-                break
-            for issue in issues:
-                out.append(issue)
-                fetched += 1
-                if max_issues and fetched >= max_issues:
+        data = response_json(r)
+        # После первой страницы известны total и реальный maxResults (Jira режет его по-своему),
+        # поэтому следующие страницы запрашиваем заранее — окном из SEARCH_PAGE_WORKERS штук,
+        # а разбираем строго по порядку: в памяти не больше окна страниц, --dump-raw пишет сразу.
+        # Если страница пришла короче шага, смещения разъехались: окно отменяем и строим заново
+        # от фактического startAt.
+        step = int(data.get("maxResults") or 0) or len(data.get("issues") or [])
+        total = data.get("total")
+        limit = 0
+        if step and total is not None:
+            limit = min(int(total), max_issues) if max_issues else int(total)
+        executor = ThreadPoolExecutor(max_workers=SEARCH_PAGE_WORKERS)
+        window: Deque[Tuple[int, Future]] = deque()
+        try:
+            while True:
+                if on_raw_page is not None:
+                    on_raw_page(
+                        {
+                            "method": "GET",
+                            "path": f"{api_prefix}/search",
+                            "params": params,
+                            "status": 200,
+                            "response": data,
+                        }
+                    )
+                issues = data.get("issues", [])
+                if not issues:
+                    break
+                if max_issues and len(out) + len(issues) >= max_issues:
+                    out.extend(issues[: max_issues - len(out)])
                     return out
-            start_at += len(issues)
-            total = data.get("total")
-            if total is not None and start_at >= int(total):
-                break
-            params = {"jql": jql, "fields": ",".join(fields), "startAt": start_at, "maxResults": page_size}
-            r = jira.request("GET", f"{api_prefix}/search", params=params)
-            if r.status_code != 200:
-                raise RuntimeError(f"Search failed: HTTP {r.status_code}: {r.text}")
-            data = r.json()
-            if raw_pages_out is not None:
-                raw_pages_out.append(
-                    {
-                        "method": "GET",
-                        "path": f"{api_prefix}/search",
-                        "params": params,
-                        "status": r.status_code,
-                        "response": data,
-                    }
-                )
+                out.extend(issues)
+                start_at += len(issues)
+                total = data.get("total")
+                if total is not None and start_at >= int(total):
+                    break
+
+                if window and window[0][0] != start_at:
+                    for _, fut in window:
+                        fut.cancel()
+                    window.clear()
+                planned = window[-1][0] + step if window else start_at
+                while len(window) < SEARCH_PAGE_WORKERS and planned < limit:
+                    window.append((planned, executor.submit(fetch_page, planned)))
+                    planned += step
+                if window:
+                    params, data = window.popleft()[1].result()
+                else:
+                    params, data = fetch_page(start_at)
+        finally:
+            # Досрочный выход (max_issues, ошибка) не ждет уже ненужные страницы окна
+            executor.shutdown(wait=False, cancel_futures=True)
         return out
 
     if r.status_code == 410:
         next_token = ""
         while True:
             data = jira.search_jql_page(jql=jql, fields=fields, max_results=page_size, next_page_token=next_token)
-            if raw_pages_out is not None:
-                raw_pages_out.append(
+            if on_raw_page is not None:
+                on_raw_page(
                     {
                         "method": "POST",
                         "path": "/rest/api/3/search/jql",
@@ -271,11 +467,10 @@ def iterate_issues(
             issues = data.get("issues", []) or data.get("values", [])
             if not issues:
                 break
-            for issue in issues:
-                out.append(issue)
-                fetched += 1
-                if max_issues and fetched >= max_issues:
-                    return out
+            if max_issues and len(out) + len(issues) >= max_issues:
+                out.extend(issues[: max_issues - len(out)])
+                return out
+            out.extend(issues)
             next_token = (data.get("nextPageToken") or "").strip()
             if not next_token:
                 break
@@ -291,7 +486,7 @@ def collect_teams(
     project_key: Optional[str],
     jql_extra: Optional[str],
     max_issues: int,
-    raw_pages_out: Optional[List[dict]] = None,
+    on_raw_page: Optional[Callable[[dict], None]] = None,
 ) -> Dict[str, int]:
     jql_parts = [f'"{team_field_id}" is not EMPTY']
     if project_key:
@@ -300,15 +495,14 @@ def collect_teams(
         jql_parts.append(f"({jql_extra})")
     jql = " AND ".join(jql_parts)
 
-    teams: Dict[str, int] = {}
     issues = iterate_issues(
-        jira, api_prefix, jql=jql, fields=[team_field_id], max_issues=max_issues, raw_pages_out=raw_pages_out
+        jira, api_prefix, jql=jql, fields=[team_field_id], max_issues=max_issues, on_raw_page=on_raw_page
     )
-    for issue in issues:
-        f = issue.get("fields", {})
-        for team in extract_team_values(f.get(team_field_id)):
-            teams[team] = teams.get(team, 0) + 1
-    return teams
+    # Counter считает весь поток значений одним вызовом (цикл подсчета — на C)
+    teams = Counter(
+        chain.from_iterable(extract_team_values(issue.get("fields", {}).get(team_field_id)) for issue in issues)
+    )
+    return dict(teams)
 
 
 def collect_team_members_and_counts(
@@ -319,7 +513,7 @@ def collect_team_members_and_counts(
     project_key: Optional[str],
     jql_extra: Optional[str],
     max_issues: int,
-    raw_pages_out: Optional[List[dict]] = None,
+    on_raw_page: Optional[Callable[[dict], None]] = None,
 ) -> Tuple[Dict[str, int], Dict[str, Dict[str, dict]]]:
     jql_parts = [f'"{team_field_id}" is not EMPTY']
     if project_key:
@@ -330,11 +524,27 @@ def collect_team_members_and_counts(
 
     fields = [team_field_id] + user_fields
     issues = iterate_issues(
-        jira, api_prefix, jql=jql, fields=fields, max_issues=max_issues, raw_pages_out=raw_pages_out
+        jira, api_prefix, jql=jql, fields=fields, max_issues=max_issues, on_raw_page=on_raw_page
     )
 
-    teams: Dict[str, int] = {}
-    team_to_users: Dict[str, Dict[str, dict]] = {}
+    teams: DefaultDict[str, int] = defaultdict(int)
+    team_to_users: DefaultDict[str, Dict[str, dict]] = defaultdict(dict)
+    # Одни и те же исполнители повторяются в тысячах задач — нормализуем каждый вариант данных
+    # пользователя один раз. Кэш по всем полям, которые читает normalize_user, поэтому как и раньше
+    # в команде остается последнее вхождение (например, с обновленным displayName/email).
+    user_cache: Dict[tuple, dict] = {}
+
+    def add_user(users: Dict[str, dict], raw: Any) -> None:
+        if not isinstance(raw, dict):
+            return
+        key = user_key(raw)
+        if not key:
+            return
+        ident = (key, raw.get("displayName"), raw.get("name"), raw.get("accountId"), raw.get("emailAddress"))
+        nu = user_cache.get(ident)
+        if nu is None:
+            nu = user_cache[ident] = normalize_user(raw)  # type: ignore[assignment]
+        users[key] = nu
 
     for issue in issues:
         f = issue.get("fields", {})
@@ -342,33 +552,29 @@ def collect_team_members_and_counts(
         if not issue_teams:
             continue
         for team in issue_teams:
-            teams[team] = teams.get(team, 0) + 1
-            team_to_users.setdefault(team, {})
+            teams[team] += 1
+            users = team_to_users[team]
             for uf in user_fields:
                 raw = f.get(uf)
                 if isinstance(raw, list):
                     for item in raw:
-                        nu = normalize_user(item)
-                        if nu:
-                            team_to_users[team][nu["key"]] = nu
+                        add_user(users, item)
                 else:
-                    nu = normalize_user(raw)
-                    if nu:
-                        team_to_users[team][nu["key"]] = nu
+                    add_user(users, raw)
 
-    return teams, team_to_users
+    return dict(teams), dict(team_to_users)
 
 
 def write_output(teams: Dict[str, int], out_path: str) -> None:
     ext = os.path.splitext(out_path.lower())[1]
-    rows = [{"team": t, "issues": n} for t, n in sorted(teams.items(), key=lambda x: x[0].lower())]
+    rows = ({"team": t, "issues": n} for t, n in sorted(teams.items(), key=lambda x: x[0].lower()))
 
     if ext in (".json", ""):
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump({"teams": rows}, f, ensure_ascii=False, indent=2)
+        write_json(out_path, {"teams": list(rows)})
         return
 
     if ext == ".csv":
+        # CSV пишем построчно, без промежуточного списка
         with open(out_path, "w", encoding="utf-8", newline="") as f:
             w = csv.DictWriter(f, fieldnames=["team", "issues"])
             w.writeheader()
@@ -380,25 +586,24 @@ def write_output(teams: Dict[str, int], out_path: str) -> None:
 
 def write_members_output(team_to_users: Dict[str, Dict[str, dict]], out_path: str) -> None:
     ext = os.path.splitext(out_path.lower())[1]
-    rows: List[dict] = []
-    for team, users in sorted(team_to_users.items(), key=lambda x: x[0].lower()):
-        for u in users.values():
-            rows.append(
-                {
-                    "team": team,
-                    "displayName": u.get("displayName"),
-                    "accountId": u.get("accountId"),
-                    "email": u.get("email"),
-                    "key": u.get("key"),
-                }
-            )
+    rows = (
+        {
+            "team": team,
+            "displayName": u.get("displayName"),
+            "accountId": u.get("accountId"),
+            "email": u.get("email"),
+            "key": u.get("key"),
+        }
+        for team, users in sorted(team_to_users.items(), key=lambda x: x[0].lower())
+        for u in users.values()
+    )
 
     if ext in (".json", ""):
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump({"teamMembers": rows}, f, ensure_ascii=False, indent=2)
+        write_json(out_path, {"teamMembers": list(rows)})
         return
 
     if ext == ".csv":
+        # CSV пишем построчно, без промежуточного списка
         with open(out_path, "w", encoding="utf-8", newline="") as f:
             w = csv.DictWriter(f, fieldnames=["team", "displayName", "accountId", "email", "key"])
             w.writeheader()
@@ -432,6 +637,12 @@ def main() -> int:
         default="",
         help="Если задано — выгрузить сотрудников по командам в team_members.csv/json",
     )
+    p.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Не брать REST-префикс и список полей из кэша ~/.cache/jira_teams, а перечитать их из Jira.",
+    )
+    p.add_argument("--no-cache", action="store_true", help="Не использовать дисковый кэш метаданных Jira.")
     p.add_argument(
         "--dump-raw",
         default="",
@@ -441,54 +652,53 @@ def main() -> int:
 
     load_env_file(args.secrets_file)
     base_url, headers = build_headers_from_env()
-    jira = Jira(base_url, headers)
+    jira = Jira(
+        base_url,
+        headers,
+        cache_dir=("" if args.no_cache else metadata_cache_dir(base_url, headers)),
+        refresh_cache=args.refresh_cache,
+    )
     api_prefix = jira.detect_api_prefix(args.api_prefix)
 
-    fields = jira.get_fields(api_prefix)
-    team_field_id = find_field_id(fields, args.team_field_name)
+    team_field_id = jira.get_field_id(api_prefix, args.team_field_name)
     eprint(f"TEAM field: {args.team_field_name} -> {team_field_id}")
 
     user_fields = [x.strip() for x in (args.user_fields or "").split(",") if x.strip()]
-    raw_pages: Optional[List[dict]] = [] if (args.dump_raw or "").strip() else None
+    # Сырые страницы пишутся в файл по мере загрузки, а не копятся в памяти до конца
+    raw_dump = RawPageDump(args.dump_raw) if (args.dump_raw or "").strip() else None
+    with raw_dump if raw_dump is not None else nullcontext():
+        if (args.members_out or "").strip():
+            teams, team_to_users = collect_team_members_and_counts(
+                jira,
+                api_prefix=api_prefix,
+                team_field_id=team_field_id,
+                user_fields=user_fields or ["assignee"],
+                project_key=(args.project.strip() or None),
+                jql_extra=(args.jql.strip() or None),
+                max_issues=(args.max_issues or 0),
+                on_raw_page=raw_dump,
+            )
+            write_output(teams, args.out)
+            write_members_output(team_to_users, args.members_out)
+            eprint(
+                f"OK. Teams: {len(teams)}. Members rows: {sum(len(u) for u in team_to_users.values())}. "
+                f"Output: {args.out}, {args.members_out}"
+            )
+            return 0
 
-    if (args.members_out or "").strip():
-        teams, team_to_users = collect_team_members_and_counts(
+        teams = collect_teams(
             jira,
             api_prefix=api_prefix,
             team_field_id=team_field_id,
-            user_fields=user_fields or ["assignee"],
             project_key=(args.project.strip() or None),
             jql_extra=(args.jql.strip() or None),
             max_issues=(args.max_issues or 0),
-            raw_pages_out=raw_pages,
+            on_raw_page=raw_dump,
         )
         write_output(teams, args.out)
-        write_members_output(team_to_users, args.members_out)
-        if raw_pages is not None:
-            with open(args.dump_raw, "w", encoding="utf-8") as f:
-                json.dump({"pages": raw_pages}, f, ensure_ascii=False, indent=2)
-        eprint(
-            f"OK. Teams: {len(teams)}. Members rows: {sum(len(u) for u in team_to_users.values())}. "
-            f"Output: {args.out}, {args.members_out}"
-        )
+        eprint(f"OK. Teams: {len(teams)}. Output: {args.out}")
         return 0
 
-    teams = collect_teams(
-        jira,
-        api_prefix=api_prefix,
-        team_field_id=team_field_id,
-        project_key=(args.project.strip() or None),
-        jql_extra=(args.jql.strip() or None),
-        max_issues=(args.max_issues or 0),
-        raw_pages_out=raw_pages,
-    )
-    write_output(teams, args.out)
-    if raw_pages is not None:
-        with open(args.dump_raw, "w", encoding="utf-8") as f:
-            json.dump({"pages": raw_pages}, f, ensure_ascii=False, indent=2)
-    eprint(f"OK. Teams: {len(teams)}. Output: {args.out}")
-    return 0
-
 
 if __name__ == "__main__":
     raise SystemExit(main())